@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+
+from codec_bank import CodecBank
+from concurrent.futures import ProcessPoolExecutor
+from lp_stat import LPStat
+from profiling import Profiler
+from rp_celp import Codec
+from voice_frame import VoiceFrame
+import argparse
+import bisect
+import decoder
+import frame_log
+import gzip
+import json
+import multiprocessing
+import numpy as np
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def lar_idx_frames(n_frames):
+    """Return (n_frames, 10) LAR indexes of encoded sine sweep."""
+    t = np.arange(160*n_frames)
+    samples = np.sin(2*np.pi*t*(200 + t/50)/Codec.samp_rate) * 2000
+    return Codec(approx=False).encode_frames(samples)
+
+
+def synthetic_log(n_lines, voice_ratio=0.5, seed=0):
+    """Return JSON lines frame log (bytes) with random VOICE frames
+    mixed with other events."""
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(n_lines):
+        if rng.random() < voice_ratio:
+            frame = {'type': 'VOICE', 'data': {'encoding': 'hex',
+                'value': rng.bytes(15).hex()}}
+        else:
+            frame = {'type': 'DATA', 'data': {'encoding': 'hex',
+                'value': rng.bytes(8).hex()}}
+        lines.append(json.dumps({'event': 'frame', 'frame_no': i, 'frame': frame}))
+        if i % 100 == 0:
+            lines.append(json.dumps({'event': 'sync', 'frame_no': i}))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def synthetic_pcm(n_frames, kind='sine', seed=0):
+    """Return (n_frames, 160) int16 frames of deterministic test signal,
+    'sine' is sweep of sines like TestCodec fixtures, 'noise' is white
+    noise, both with range +-(2**12-1)."""
+    t = np.arange(160*n_frames)
+    if kind == 'sine':
+        freqs = np.array((50, 220, 440, 900, 1000, 2000))
+        f = freqs[t // 160 % len(freqs)]
+        samples = np.sin(2*np.pi*f*t/Codec.samp_rate) * (2**12-1)
+    elif kind == 'noise':
+        rng = np.random.default_rng(seed)
+        samples = np.clip(rng.normal(size=len(t)) * 1000, -(2**12-1), 2**12-1)
+    else:
+        raise ValueError('Unknown signal: %s' % kind)
+    return np.round(samples).astype(np.int16).reshape(n_frames, 160)
+
+
+def latency_stats(times, n_items=None):
+    """Return dictionary with frames/sec and latency percentiles in seconds
+    of per item execution times. Times of batches (n_items given and
+    different from number of times) say nothing about latency of one item,
+    their percentiles are None (not applicable)."""
+    times = np.asarray(times)
+    total = times.sum()
+    n_items = len(times) if n_items is None else n_items
+    r = {'frames_per_sec': n_items / total if total else 0., }
+    for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100), ):
+        r[name] = float(np.percentile(times, q)) if n_items == len(times) else None
+    return r
+
+
+def timed(fnc, args):
+    """Call fnc for each of args, return list of execution times."""
+    times = []
+    for arg in args:
+        start = time.perf_counter()
+        fnc(arg)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def suite_case(name, n_frames):
+    """Run one case of benchmark suite, return its metrics. Executed in new
+    process, so peak RSS belongs to the case."""
+    subframe = {'stochastic_gain': 0}
+    start = time.perf_counter()
+    codec = Codec(seed=0)
+    codec.noise
+    construct = time.perf_counter() - start
+
+    if name in ('encode_sine', 'encode_noise'):
+        frames = synthetic_pcm(n_frames, name.split('_')[1])
+        r = latency_stats(timed(codec.encode, frames))
+    elif name == 'encode_frames':
+        frames = synthetic_pcm(n_frames, 'noise')
+        r = latency_stats(timed(codec.encode_frames, [frames]), n_frames)
+    elif name == 'decode':
+        lar_idxs = Codec().encode_frames(synthetic_pcm(n_frames, 'noise'))
+        r = latency_stats(timed(lambda lar_idx:
+            codec.decode(lar_idx, subframe, subframe, subframe), lar_idxs))
+    elif name == 'decode_frames':
+        lar_idxs = Codec().encode_frames(synthetic_pcm(n_frames, 'noise'))
+        r = latency_stats(timed(codec.decode_frames, [lar_idxs]), n_frames)
+    elif name == 'voice_frame':
+        frames = [bytes(frame) for frame in np.random.default_rng(0).integers(
+            0, 256, (n_frames, VoiceFrame.frame_len), dtype=np.uint8)]
+        r = latency_stats(timed(VoiceFrame, frames))
+    elif name == 'voice_frame_many':
+        frames = np.random.default_rng(0).integers(
+            0, 256, (n_frames, VoiceFrame.frame_len), dtype=np.uint8).tobytes()
+        r = latency_stats(timed(VoiceFrame.decode_many, [frames]), n_frames)
+    elif name == 'voice_decoder':
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_file_name = os.path.join(tmp_dir, 'call.json')
+            with open(in_file_name, 'wb') as f:
+                f.write(synthetic_log(2*n_frames))
+            out_file_name = os.path.join(tmp_dir, 'call.wav')
+            start = time.perf_counter()
+            n = decoder.decode_file(in_file_name, out_file_name)
+            r = latency_stats([time.perf_counter() - start], n)
+    elif name == 'lp_stat':
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_file_name = os.path.join(tmp_dir, 'audio.pcm')
+            synthetic_pcm(n_frames, 'sine').tofile(in_file_name)
+            lp_stat = LPStat()
+            r = latency_stats(timed(lp_stat.add_file, [in_file_name]), n_frames)
+    else:
+        raise ValueError('Unknown benchmark case: %s' % name)
+
+    r['codec_construct'] = construct
+    r['peak_rss_kb'] = peak_rss_kb()
+    return r
+
+
+def peak_rss_kb():
+    """Return peak RSS of the process in kB. ru_maxrss of Linux survives
+    exec(), so spawned process would report memory of its parent, VmHWM
+    of the new address space is used where available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def fresh_process():
+    """Return executor running jobs in one spawned (not forked) process,
+    so the job does not inherit caches (noise tables) and memory of the
+    benchmark process."""
+    return ProcessPoolExecutor(max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'))
+
+
+suite_cases = ('encode_sine', 'encode_noise', 'encode_frames', 'decode',
+        'decode_frames', 'voice_frame', 'voice_frame_many', 'voice_decoder', 'lp_stat', )
+
+
+def run_suite(sizes=(100, 1000), cases=suite_cases):
+    """Run every case for every size of workload (in frames), each in
+    separate process. Returns dictionary 'case/size' -> metrics."""
+    results = {}
+    for name in cases:
+        for n_frames in sizes:
+            with fresh_process() as executor:
+                results['%s/%d' % (name, n_frames)] = executor.submit(
+                        suite_case, name, n_frames).result()
+    return results
+
+
+# compared metrics, True when higher value is better
+suite_metrics = {'frames_per_sec': True, 'p50': False, 'p99': False,
+        'peak_rss_kb': False, }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Compare suite results with baseline results, return list of
+    (case, metric, baseline value, value) of metrics worse by more than
+    tolerance (relative). Cases missing in baseline and not applicable
+    (None) metrics are skipped."""
+    regressions = []
+    for case, r in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        for metric, higher_better in suite_metrics.items():
+            if r.get(metric) is None or not base.get(metric):
+                continue
+            change = r[metric] / base[metric] - 1
+            if (-change if higher_better else change) > tolerance:
+                regressions.append((case, metric, base[metric], r[metric]))
+    return regressions
+
+
+def print_suite(results, baseline=None, out=sys.stdout):
+    """Print suite results as CSV, latency percentiles of batch cases are
+    not applicable and left empty."""
+    def us(value):
+        return '' if value is None else '%f' % (value*1e6)
+
+    print("case,frames/sec,p50 [us],p99 [us],construct [ms],peak RSS [kB],"
+            "baseline frames/sec,", file=out)
+    for case, r in results.items():
+        base = (baseline or {}).get(case, {}).get('frames_per_sec')
+        print("%s,%f,%s,%s,%f,%d,%s," % (case, r['frames_per_sec'], us(r['p50']),
+            us(r['p99']), r['codec_construct']*1e3, r['peak_rss_kb'],
+            '' if base is None else '%f' % base), file=out)
+
+
+def bench_encode(n_frames=200):
+    """Frames/sec of encode() with subframe search and of LP analysis only
+    (encode_frames()) for synthetic signals."""
+    print("signal,encode [frames/sec],encode_frames [frames/sec],")
+# scipy import of search is not counted
+    Codec().encode(synthetic_pcm(1, 'sine')[0])
+    for kind in ('sine', 'noise'):
+        frames = synthetic_pcm(n_frames, kind)
+        codec = Codec()
+        start = time.perf_counter()
+        for frame in frames:
+            codec.encode(frame)
+        encode_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        Codec().encode_frames(frames)
+        frames_duration = time.perf_counter() - start
+        print("%s,%f,%f," % (kind, n_frames / encode_duration,
+            n_frames / frames_duration))
+
+
+def bench_filter_backends(n_frames=200):
+    """Decode frames using each short term filter backend, print frames/sec."""
+    lar_idxs = lar_idx_frames(n_frames)
+    subframe = {'stochastic_gain': 0}
+    print("filter_backend,frames/sec,")
+    for filter_backend in Codec.filter_backends:
+# imports of backend (scipy) and noise table are not counted
+        Codec(approx=False, filter_backend=filter_backend).decode(lar_idxs[0])
+        codec = Codec(approx=False, filter_backend=filter_backend)
+        start = time.perf_counter()
+        for lar_idx in lar_idxs:
+            codec.decode(lar_idx, subframe, subframe, subframe)
+        duration = time.perf_counter() - start
+        print("%s,%f," % (filter_backend, n_frames / duration))
+
+
+def bench_lp_analysis(batch_sizes=(1, 64, 4096), n_frames=8192):
+    """Frames/sec of LP analysis stages for frames processed in batches."""
+    codec = Codec()
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(n_frames, 160)) * 500 / (2**12-1)
+    print("batch,autocorrelate,autocorr2refl_coeffs,encode_frames,")
+    for batch_size in batch_sizes:
+        if batch_size == 1:
+            batches = list(samples[:n_frames // 8])
+        else:
+            batches = [samples[i:i+batch_size] for i in range(0, n_frames, batch_size)]
+        n = sum(len(np.atleast_2d(b)) for b in batches)
+        autocorrs = [codec.autocorrelate(b) for b in batches]
+        fps = []
+        for fnc, args in ((codec.autocorrelate, batches),
+                (codec.autocorr2refl_coeffs, autocorrs),
+                (codec.encode_frames, [b * (2**12-1) for b in batches])):
+            start = time.perf_counter()
+            for arg in args:
+                fnc(arg)
+            fps.append(n / (time.perf_counter() - start))
+        print("%d,%f,%f,%f," % ((batch_size, ) + tuple(fps)))
+
+
+class BaselineLARs:
+    """LAR quantization stages of the original implementation (bisect and
+    per coefficient loops), kept to benchmark against. Its rounding test
+    has wrong sign, so indexes differ, but amount of work is the same."""
+    def __init__(self, approx):
+        self.approx = approx
+        self.old_lars = None
+
+    def lars2lar_idxs(self, lars):
+        lar_idx = []
+        for i in range(len(Codec.LAR_idx)):
+            lar = lars[i]
+            LAR_idx = Codec.LAR_idx[i]
+            if lar >= LAR_idx[-1]:
+                lar_idx.append(len(LAR_idx) - 1)
+                continue
+            if lar <= LAR_idx[0]:
+                lar_idx.append(0)
+                continue
+            idx = bisect.bisect_left(LAR_idx, lar)
+            if (LAR_idx[idx-1] - lar) / (LAR_idx[idx] - LAR_idx[idx-1]) >= 0.5:
+                lar_idx.append(idx+1)
+                continue
+            lar_idx.append(idx)
+        return lar_idx
+
+    def lar_idxs2lars(self, lar_idx):
+        return np.array([Codec.LAR_idx[i][lar_idx[i]] for i in range(len(lar_idx))])
+
+    def refl_coefs3(self, lar_idx):
+        lars = self.lar_idxs2lars(lar_idx)
+        if self.old_lars is None:
+            lars3 = (lars, lars, lars)
+        else:
+            lars3 = (0.875*self.old_lars + 0.125*lars,
+                    0.500*self.old_lars + 0.500*lars,
+                    0.125*self.old_lars + 0.875*lars)
+        self.old_lars = lars
+        return [self.lar2refl_coef(l) for l in lars3]
+
+    def lar2refl_coef(self, lars):
+        if not self.approx:
+            lars = np.power(10, lars)
+            return (lars - 1)/(lars + 1)
+        refl_coefs = []
+        for lar in lars:
+            abs_lar = abs(lar)
+            if abs_lar < 0.675:
+                refl_coef = lar
+            elif abs_lar < 1.225:
+                refl_coef = np.copysign(0.5*abs_lar + 0.3375, lar)
+            else:
+                refl_coef = np.copysign(0.125*abs_lar + 0.796875, lar)
+            refl_coefs.append(refl_coef)
+        return refl_coefs
+
+
+def bench_lar_stages(n_frames=2000):
+    """Microseconds per frame of LAR quantization stages of non-repeating
+    (noise) input: the original implementation, the current one called
+    frame by frame and batch calls."""
+    codec = Codec(approx=False)
+    samples = synthetic_pcm(n_frames, 'noise') / (2**12-1)
+    lars = codec.refl_coefs2lars(codec.autocorr2refl_coeffs(
+        codec.autocorrelate(samples) * Codec.band_expansion))
+    lar_idxs = codec.lars2lar_idxs(lars)
+
+    def per_frame(fnc, *args):
+        start = time.perf_counter()
+        fnc(*args)
+        return (time.perf_counter() - start) / n_frames * 1e6
+
+    def interpolate_baseline(baseline):
+        for lar_idx in lar_idxs:
+            baseline.refl_coefs3(lar_idx)
+
+    def interpolate(codec):
+        for lar_idx in lar_idxs:
+            codec.lar_idxs2refl_coefs(lar_idx)
+
+    baseline = BaselineLARs(approx=False)
+    print("stage,baseline [us/frame],per frame [us/frame],batch [us/frame],")
+    print("quantize,%f,%f,%f," % (
+        per_frame(lambda: [baseline.lars2lar_idxs(l) for l in lars]),
+        per_frame(lambda: [codec.lars2lar_idxs(l) for l in lars]),
+        per_frame(codec.lars2lar_idxs, lars)))
+    print("dequantize,%f,%f,%f," % (
+        per_frame(lambda: [baseline.lar_idxs2lars(i) for i in lar_idxs]),
+        per_frame(lambda: [codec.lar_idxs2lars(i) for i in lar_idxs]),
+        per_frame(codec.lar_idxs2lars, lar_idxs)))
+    for approx in (False, True):
+        codec = Codec(approx=approx)
+        codec.profiler = Profiler()
+        codec.decode_frames(lar_idxs)
+        stages = codec.profiler.stages
+        batch = sum(stages[name]['seconds'] for name in ('dequantize', 'interpolate'))
+        print("dequantize+interpolate+lar2refl_coef (approx=%s),%f,%f,%f," % (approx,
+            per_frame(interpolate_baseline, BaselineLARs(approx)),
+            per_frame(interpolate, Codec(approx=approx)),
+            batch / n_frames * 1e6))
+
+
+def codec_startup(n_codecs):
+    """Create n_codecs instances and decode one frame by each of them.
+    Return creation time, time of first decode and peak RSS in kB."""
+    subframe = {'stochastic_gain': 0}
+    lar_idx = [0, ] * 10
+    start = time.perf_counter()
+    codecs = [Codec() for i in range(n_codecs)]
+    created = time.perf_counter()
+    for codec in codecs:
+        codec.decode(lar_idx, subframe, subframe, subframe)
+    decoded = time.perf_counter()
+    rss = peak_rss_kb()
+    return created - start, decoded - created, rss
+
+
+def bench_codec_startup(counts=(1, 100, 1000)):
+    """Time and peak RSS of Codec creation, each count runs in new process."""
+    print("codecs,create [s],first decode [s],peak RSS [kB],")
+    for n_codecs in counts:
+        with fresh_process() as executor:
+            r = executor.submit(codec_startup, n_codecs).result()
+        print("%d,%f,%f,%d," % ((n_codecs, ) + r))
+
+
+def bench_frame_log(n_lines=200000):
+    """Lines/sec of reading VOICE frames from plain and gzip JSON log,
+    compared with parsing every line by json.loads()."""
+    log = synthetic_log(n_lines)
+    n_lines = log.count(b'\n')
+    print("reader,lines/sec,")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plain_name = os.path.join(tmp_dir, 'log.json')
+        gzip_name = os.path.join(tmp_dir, 'log.json.gz')
+        with open(plain_name, 'wb') as f:
+            f.write(log)
+        with gzip.open(gzip_name, 'wb') as f:
+            f.write(log)
+
+        start = time.perf_counter()
+        with open(plain_name, 'rt') as f:
+            frames = [frame_log.get_voice_frame(line) for line in f]
+        duration = time.perf_counter() - start
+        print("json.loads,%f," % (n_lines / duration))
+
+        for name, file_name in (('frame_log', plain_name), ('frame_log_gzip', gzip_name)):
+            start = time.perf_counter()
+            with frame_log.open_log(file_name) as f:
+                for frames in frame_log.iter_voice_frame_batches(f):
+                    pass
+            duration = time.perf_counter() - start
+            print("%s,%f," % (name, n_lines / duration))
+
+
+def bench_decode_jobs(jobs=(1, 2, 4, 8), n_files=16, n_lines=400):
+    """Frames/sec of decoding n_files synthetic logs by decoder.decode_files()
+    with different number of worker processes."""
+    print("jobs,time [s],frames/sec,errors,")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for i in range(n_files):
+            in_file_name = os.path.join(tmp_dir, 'call%03d.json' % i)
+            with open(in_file_name, 'wb') as f:
+                f.write(synthetic_log(n_lines, seed=i))
+            files.append((in_file_name, os.path.join(tmp_dir, 'call%03d.wav' % i)))
+
+        for n_jobs in jobs:
+            start = time.perf_counter()
+            results = decoder.decode_files(files, jobs=n_jobs)
+            duration = time.perf_counter() - start
+            n_frames = sum(r[2] for r in results)
+            n_errors = sum(r[4] is not None for r in results)
+            print("%d,%f,%f,%d," % (n_jobs, duration, n_frames / duration, n_errors))
+
+
+def bench_pipeline(workers=(1, 2, 4), n_files=8, n_lines=1000):
+    """Frames/sec of decoding n_files synthetic logs in single process
+    (decoder.decode_files() with one job) and by shared memory pipeline
+    with different number of decode workers."""
+    import shm_pipeline
+    print("mode,workers,time [s],frames/sec,errors,")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for i in range(n_files):
+            in_file_name = os.path.join(tmp_dir, 'call%03d.json' % i)
+            with open(in_file_name, 'wb') as f:
+                f.write(synthetic_log(n_lines, seed=i))
+            files.append((in_file_name, os.path.join(tmp_dir, 'call%03d.wav' % i)))
+
+        runs = [('single', 1, lambda: decoder.decode_files(files, jobs=1))]
+        runs += [('pipeline', n, lambda n=n: shm_pipeline.decode_files_pipeline(
+            files, workers=n)) for n in workers]
+        for mode, n_workers, run in runs:
+            start = time.perf_counter()
+            results = run()
+            duration = time.perf_counter() - start
+            n_frames = sum(r[2] for r in results)
+            n_errors = sum(r[4] is not None for r in results)
+            print("%s,%d,%f,%f,%d," % (mode, n_workers, duration,
+                n_frames / duration, n_errors))
+
+
+def bench_codec_bank(channels=(1, 16, 128), n_frames=50):
+    """Total frames/sec of decoding concurrent channels by CodecBank compared
+    with separate Codec per channel."""
+    lar_idxs = lar_idx_frames(n_frames)
+    subframe = {'stochastic_gain': 0}
+    print("channels,Codec [frames/sec],CodecBank [frames/sec],")
+    for n_channels in channels:
+        codecs = [Codec(approx=False) for i in range(n_channels)]
+        start = time.perf_counter()
+        for lar_idx in lar_idxs:
+            for codec in codecs:
+                codec.decode(lar_idx, subframe, subframe, subframe)
+        codec_fps = n_frames * n_channels / (time.perf_counter() - start)
+
+        bank = CodecBank(n_channels, approx=False)
+        for i in range(n_channels):
+            bank.join()
+        start = time.perf_counter()
+        for lar_idx in lar_idxs:
+            bank.decode(np.broadcast_to(lar_idx, (n_channels, 10)))
+        bank_fps = n_frames * n_channels / (time.perf_counter() - start)
+        print("%d,%f,%f," % (n_channels, codec_fps, bank_fps))
+
+
+def precision_case(precision, n_frames):
+    """Frames/sec of decode(), decode_frames() and encode_frames() in given
+    precision, size of noise table in kB and peak RSS in kB."""
+    samples = synthetic_pcm(n_frames, 'noise')
+    lar_idxs = Codec().encode_frames(samples)
+    noise_kb = Codec(seed=0, precision=precision).noise.nbytes // 1024
+    fps = []
+    for fnc, args in ((Codec(seed=0, precision=precision).decode, lar_idxs),
+            (Codec(seed=0, precision=precision).decode_frames, [lar_idxs]),
+            (Codec(precision=precision).encode_frames, [samples])):
+        start = time.perf_counter()
+        for arg in args:
+            fnc(arg)
+        fps.append(n_frames / (time.perf_counter() - start))
+    rss = peak_rss_kb()
+    return tuple(fps) + (noise_kb, rss)
+
+
+def bench_precision(n_frames=500):
+    """Throughput and memory of Codec precisions, each runs in new process."""
+    print("precision,decode [frames/sec],decode_frames [frames/sec],"
+            "encode_frames [frames/sec],noise table [kB],peak RSS [kB],")
+    for precision in Codec.precisions:
+        with fresh_process() as executor:
+            r = executor.submit(precision_case, precision, n_frames).result()
+        print("%s,%f,%f,%f,%d,%d," % ((precision, ) + r))
+
+
+# command line tools started from shell pipelines
+startup_modules = ('voice_frame', 'rp_celp', 'decoder', 'lp_stat', )
+
+
+def import_time(module):
+    """Import module in new interpreter with -X importtime. Return wall time
+    of the interpreter run, cumulative import time of module (both in
+    seconds) and set of imported top level packages."""
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+        'import %s' % module], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.PIPE, text=True, check=True)
+    wall = time.perf_counter() - start
+    cumulative = None
+    packages = set()
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, us, name = line.split('|')
+        packages.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            cumulative = int(us) * 1e-6
+    return wall, cumulative, packages
+
+
+def bench_startup(modules=startup_modules):
+    """Interpreter startup and import time of command line tools."""
+    print("module,process [ms],import [ms],scipy,")
+    for module in modules:
+        wall, cumulative, packages = import_time(module)
+        print("%s,%f,%f,%s," % (module, wall * 1e3, cumulative * 1e3,
+            'scipy' in packages))
+
+
+benchmarks = {
+        'encode': bench_encode,
+        'filter_backends': bench_filter_backends,
+        'codec_startup': bench_codec_startup,
+        'frame_log': bench_frame_log,
+        'lar_stages': bench_lar_stages,
+        'lp_analysis': bench_lp_analysis,
+        'decode_jobs': bench_decode_jobs,
+        'codec_bank': bench_codec_bank,
+        'pipeline': bench_pipeline,
+        'startup': bench_startup,
+        'precision': bench_precision,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Codec benchmarks, "suite" '
+            'runs reproducible suite which can be compared with baseline.')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+            help='benchmarks to run: suite, %s (default all but suite)' %
+                ', '.join(benchmarks))
+    parser.add_argument('--sizes', type=int, nargs='+', default=(100, 1000),
+            help='suite workload sizes in frames')
+    parser.add_argument('--cases', nargs='+', default=suite_cases,
+            choices=suite_cases, help='suite cases')
+    parser.add_argument('--json', metavar='FILE', help='save suite results')
+    parser.add_argument('--baseline', metavar='FILE',
+            help='compare suite with results saved by --json')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+            help='relative change of metric reported as regression')
+    args = parser.parse_args()
+
+    names = args.names or list(benchmarks.keys())
+    for name in names:
+        if name != 'suite' and name not in benchmarks:
+            parser.error('Unknown benchmark: %s' % name)
+
+    regressions = []
+    for name in names:
+        if name != 'suite':
+            benchmarks[name]()
+            continue
+        results = run_suite(args.sizes, args.cases)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        print_suite(results, baseline)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=1)
+        if baseline is not None:
+            regressions = compare(results, baseline, args.tolerance)
+            for case, metric, base, value in regressions:
+                print("REGRESSION %s %s: %g -> %g" % (case, metric, base, value),
+                        file=sys.stderr)
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,148 @@
+from rp_celp import Codec, LARQuantizer
+import numpy as np
+
+
+class CodecBank:
+    """Decoder of many concurrent channels (talkgroups) stepped together.
+
+    State of all channels is kept in arrays with channel as the first axis,
+    LAR interpolation and lattice synthesis filter run vectorized across
+    channels. Output of every channel is same as output of separate
+    Codec(filter_backend='python') with same seed."""
+    def __init__(self, n_channels, approx=True, seed=None):
+        self.approx = approx
+        self.seed = seed
+        self.old_lars = np.zeros((n_channels, 10))
+# channel has no previous LARs yet (first frame is not interpolated)
+        self.has_old_lars = np.zeros(n_channels, dtype=bool)
+        self.prec = np.zeros((n_channels, 81))
+        self.s_prev = np.zeros(n_channels)
+        self.v = np.zeros((n_channels, 11))
+        self.noise_offs = np.zeros(n_channels, dtype=np.int64)
+        self.active = np.zeros(n_channels, dtype=bool)
+# reflection coefficients set used for each sample of frame
+# (see Codec.subframe_slices())
+        self.subframe_idx = np.zeros(160, dtype=np.intp)
+        self.subframe_idx[Codec.N[0] + 1:] = 1
+        self.subframe_idx[Codec.N[0] + Codec.N[1] + 1:] = 2
+
+    @property
+    def n_channels(self):
+        return len(self.active)
+
+    @property
+    def noise(self):
+        return Codec.noise_table(self.seed)
+
+    def join(self):
+        """Allocate channel for new call, return its index. State of the
+        channel is reset, the bank grows when all channels are in use."""
+        free = np.flatnonzero(~self.active)
+        if len(free):
+            channel = free[0]
+        else:
+            channel = self.n_channels
+            self.grow(max(1, self.n_channels))
+        self.reset(channel)
+        self.active[channel] = True
+        return int(channel)
+
+    def leave(self, channel):
+        """Release channel of finished call."""
+        self.active[channel] = False
+
+    def grow(self, n):
+        """Add n inactive channels."""
+        for attr in ('old_lars', 'has_old_lars', 'prec', 's_prev', 'v',
+                'noise_offs', 'active', ):
+            value = getattr(self, attr)
+            pad = np.zeros((n, ) + value.shape[1:], dtype=value.dtype)
+            setattr(self, attr, np.concatenate((value, pad)))
+
+    def reset(self, channel):
+        """Set channel state same as of new Codec."""
+        self.old_lars[channel] = 0
+        self.has_old_lars[channel] = False
+        self.prec[channel] = 0
+        self.s_prev[channel] = 0
+        self.v[channel] = 0
+        self.noise_offs[channel] = 0
+
+    def get_state(self, channel):
+        """Return state of channel in Codec.get_state() format, encoder
+        state is that of new Codec."""
+        state = Codec(approx=self.approx).get_state()
+        state.update({
+                'old_lars': self.old_lars[channel].copy()
+                    if self.has_old_lars[channel] else None,
+                'prec': self.prec[channel].copy(),
+                's_prev': self.s_prev[channel].item(),
+                'v': self.v[channel].copy(),
+                'noise_offs': int(self.noise_offs[channel]),
+                })
+        return state
+
+    def set_state(self, channel, state):
+        """Load channel state from Codec.get_state() snapshot."""
+        self.has_old_lars[channel] = state['old_lars'] is not None
+        if state['old_lars'] is not None:
+            self.old_lars[channel] = state['old_lars']
+        self.prec[channel] = state['prec']
+        self.s_prev[channel] = state['s_prev']
+        self.v[channel] = state['v']
+        self.noise_offs[channel] = state['noise_offs']
+
+    def decode(self, lar_idx, channels=None):
+        """Decode one frame of each channel. lar_idx is (n, 10) array of LAR
+        indexes for channels (default all active channels in increasing
+        order). Return (n, 160) array of samples."""
+        if channels is None:
+            channels = np.flatnonzero(self.active)
+        channels = np.asarray(channels, dtype=np.intp)
+        lar_idx = np.asarray(lar_idx).reshape(len(channels), 10)
+        refl_coefs3 = self.lar_idxs2refl_coefs(lar_idx, channels)
+
+        noise = self.noise
+        noise_offs = self.noise_offs[channels] + 160
+        noise_offs[noise_offs >= len(noise)] = 160
+        self.noise_offs[channels] = noise_offs
+        d = noise[noise_offs[:, None] + np.arange(-160, 0)] * Codec.noise_gain
+
+        return self.short_term_synthesis_filtering(d, refl_coefs3, channels)
+
+    def lar_idxs2refl_coefs(self, lar_idx, channels):
+        """Return (3, n, 10) reflection coefficients of subframes, LARs
+        are interpolated as by LARQuantizer.interpolate_refl_coefs()."""
+        lars = Codec.quantizer.dequantize(lar_idx)
+        w = LARQuantizer.interpolation
+        old_lars = np.where(self.has_old_lars[channels, None],
+                self.old_lars[channels], lars)
+        lars3 = w[:, 0, None, None]*old_lars + w[:, 1, None, None]*lars
+# channels without history use current LARs for all subframes
+        lars3[:, ~self.has_old_lars[channels]] = lars[~self.has_old_lars[channels]]
+        self.old_lars[channels] = lars
+        self.has_old_lars[channels] = True
+        if self.approx:
+            return Codec.lar2refl_coef_approx(lars3)
+        return Codec.lar2refl_coef_eval(lars3)
+
+    def short_term_synthesis_filtering(self, d, refl_coefs3, channels):
+        """Lattice synthesis filter of Codec.short_term_synthesis_filtering_python(),
+        each step processes all channels. d is (n, 160) excitation."""
+# channels in columns, rows are accessed in loop
+        r3 = np.ascontiguousarray(refl_coefs3.transpose(0, 2, 1))
+        v = self.v[channels].T.copy()
+        d = d.T
+        s = np.empty(d.shape)
+
+        for k in range(len(d)):
+            r = r3[self.subframe_idx[k]]
+            sri = d[k]
+            for i in range(1, 11):
+                sri = sri - r[10 - i]*v[10-i]
+                v[11-i] = v[10-i] + r[10 - i]*sri
+            s[k] = sri
+            v[0] = sri
+
+        self.v[channels] = v.T
+        return s.T
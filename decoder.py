@@ -1,63 +1,408 @@
 #!/usr/bin/env python3
 
-from binascii import unhexlify
+from profiling import Profiler, null_profiler
 from rp_celp import Codec
-from struct import pack
 from voice_frame import VoiceFrame
-import json
+import argparse
+import frame_container
+import frame_log
+import hashlib
+import numpy as np
+import os
+import pcm_writer
+import pickle
 import sys
-import wave
+import time
+
+
+def decode_voice_data(codec, data):
+    """Decode raw VOICE frame data by codec, return 160 samples."""
+    with codec.profiler.stage('bit_unpack'):
+        record = VoiceFrame(data).record
+    return codec.decode(record)
+
+
+def decode_records(codec, records):
+    """Decode array of VoiceFrame records by codec at once, return (N, 160)
+    array of samples."""
+    lar_idx = np.stack([records[name] for name in Codec.lar_fields], axis=-1)
+    gains = np.stack([records[name] for name in Codec.gain_fields], axis=-1)
+    return codec.decode_frames(lar_idx, gains)
 
 
 class VoiceDecoder:
-    """Decode VOICE frames from JSON format into WAV file."""
-    def __init__(self, out_file):
-        self.out_file = wave.open(out_file, 'wb')
-        self.out_file.setnchannels(1)
-        self.out_file.setsampwidth(2)
-        self.out_file.setframerate(8000)
+    """Decode VOICE frames from JSON format into WAV or raw PCM file.
+    If number of frames is known the output file is preallocated.
+    Stages of decoding are timed by profiler if it is given."""
+    def __init__(self, out_file, n_frames=None, profiler=None):
+        n_samples = None if n_frames is None else 160 * n_frames
+        self.out_file = pcm_writer.open_pcm(out_file, n_samples=n_samples,
+                samp_rate=Codec.samp_rate)
         self.codec = Codec(approx=False)
+        self.profiler = null_profiler if profiler is None else profiler
+        if profiler is not None:
+            self.codec.profiler = profiler
+            self.out_file.profiler = profiler
 
     def decode_frame(self, frame):
         data = self.get_voice_data(frame)
         if data is None:
             return
-        voice_frame = VoiceFrame(data)
-        lar_idx = []
-        for i in range(1, 11):
-            lar_idx.append(voice_frame.values['LAR%02d' % i])
-        subframe1 = { 'stochastic_gain': voice_frame.values['stochastic_gain1'] }
-        subframe2 = { 'stochastic_gain': voice_frame.values['stochastic_gain2'] }
-        subframe3 = { 'stochastic_gain': voice_frame.values['stochastic_gain3'] }
-        snd = self.codec.decode(lar_idx=lar_idx, subframe1=subframe1,
-                subframe2 = subframe2, subframe3=subframe3)
-        snd = snd*32767
-        snd = [int(s) for s in snd]
-        snd = pack('>160h', *snd)
-        self.out_file.writeframes(snd)
+        self.decode_voice_data(data)
+
+    def decode_voice_data(self, data):
+        """Decode raw VOICE frame data."""
+        self.out_file.write(decode_voice_data(self.codec, data))
+
+    def decode_voice_data_many(self, frames):
+        """Decode list of raw VOICE frames data or (N, 15) uint8 array."""
+        n = len(frames)
+        if not isinstance(frames, np.ndarray):
+            frames = frame_log.voice_frames2array(frames)
+        with self.profiler.stage('bit_unpack', n):
+            records = VoiceFrame.decode_many(frames)
+        self.out_file.write(decode_records(self.codec, records))
 
     def get_voice_data(self, frame):
         """Return VOICE frame data from JSON encoded frame or None."""
-        j = json.loads(frame)
-        if j['event'] != 'frame':
-            return
-        j = j['frame']
-        if j['type'] != 'VOICE':
-            return
-        j = j['data']
-        if j['encoding'] != 'hex':
+        with self.profiler.stage('json_parse'):
+            return frame_log.get_voice_frame(frame)
+
+    def close(self):
+        self.out_file.close()
+
+
+def decode_file(in_file_name, out_file_name, profiler=None, start_time=None,
+        end_time=None):
+    """Decode frame log or frame container into WAV or raw PCM file, return
+    number of frames. Frames of container can be limited to time range."""
+    if frame_container.is_container(in_file_name):
+        return decode_container(in_file_name, out_file_name, profiler=profiler,
+                start_time=start_time, end_time=end_time)
+    if start_time is not None or end_time is not None:
+        raise ValueError('Time range requires frame container input')
+    voice_decoder = VoiceDecoder(out_file_name, profiler=profiler)
+    n_frames = 0
+    try:
+        with frame_log.open_log(in_file_name) as in_file:
+# time of reading is accounted to JSON parsing
+            start = time.perf_counter()
+            for frames in frame_log.iter_voice_frame_batches(in_file):
+                voice_decoder.profiler.add('json_parse', time.perf_counter() - start,
+                        len(frames))
+                voice_decoder.decode_voice_data_many(frames)
+                n_frames += len(frames)
+                start = time.perf_counter()
+    finally:
+        voice_decoder.close()
+    return n_frames
+
+
+def decode_container(in_file_name, out_file_name, profiler=None, start_time=None,
+        end_time=None):
+    """Decode frames of container with timestamps in range
+    <start_time, end_time), only the range is read from the file."""
+    container = frame_container.FrameContainer(in_file_name)
+    first = 0 if start_time is None else container.find_time(start_time)
+    last = len(container) if end_time is None else container.find_time(end_time)
+    last = max(first, last)
+    container.check_single_stream(first, last)
+    voice_decoder = VoiceDecoder(out_file_name, n_frames=last - first,
+            profiler=profiler)
+    try:
+        for i in range(first, last, 1024):
+            voice_decoder.decode_voice_data_many(container.data(i, min(i + 1024, last)))
+    finally:
+        voice_decoder.close()
+    return last - first
+
+
+def decode_file_job(in_file_name, out_file_name, profiler=None, start_time=None,
+        end_time=None):
+    """Run decode_file() in worker, errors are returned instead of raised.
+    Returns tuple (in_file_name, out_file_name, frames, duration, error)."""
+    start = time.perf_counter()
+    try:
+        n_frames = decode_file(in_file_name, out_file_name, profiler=profiler,
+                start_time=start_time, end_time=end_time)
+        error = None
+    except Exception as e:
+        n_frames = 0
+        error = '%s: %s' % (type(e).__name__, e)
+    return in_file_name, out_file_name, n_frames, time.perf_counter() - start, error
+
+
+def decode_file_profiled_job(in_file_name, out_file_name, start_time=None,
+        end_time=None):
+    """Run decode_file_job() with stages timing, returns tuple of its result
+    and Profiler."""
+    profiler = Profiler()
+    return decode_file_job(in_file_name, out_file_name, profiler, start_time,
+            end_time), profiler
+
+
+def decode_files(files, jobs=1, profiler=None, start_time=None, end_time=None):
+    """Decode list of (in_file_name, out_file_name) pairs by jobs worker
+    processes, each file is decoded by its own VoiceDecoder. Returns list
+    of decode_file_job() results in order of files. Stage timing of all
+    workers is merged into profiler if it is given."""
+    job = decode_file_job if profiler is None else decode_file_profiled_job
+    kwargs = {'start_time': start_time, 'end_time': end_time}
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(job, in_file_name, out_file_name, **kwargs)
+                for in_file_name, out_file_name in files]
+        results = []
+        for (in_file_name, out_file_name), future in zip(files, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+# worker process died
+                result = (in_file_name, out_file_name, 0, 0.,
+                    '%s: %s' % (type(e).__name__, e))
+            else:
+                if profiler is not None:
+                    result, worker_profiler = result
+                    profiler.merge(worker_profiler)
+            results.append(result)
+    return results
+
+
+def decode_shard(frames, first_frame, n_warmup=0, seed=0, state=None):
+    """Decode frames of one shard of stream starting at frame first_frame.
+    The first n_warmup frames are decoded only to warm up codec state, state
+    is the exact state from previous shard if known.
+    Returns 16 bit PCM of shard and codec state after the last frame."""
+    codec = Codec(approx=False, seed=seed)
+    if state is not None:
+        codec.set_state(state)
+    else:
+        codec.noise_offs = Codec.noise_offs_at(first_frame - n_warmup)
+    pcm = np.empty((len(frames) - n_warmup, 160), dtype=np.int16)
+    for i, data in enumerate(frames):
+        snd = decode_voice_data(codec, data)
+        if i >= n_warmup:
+            pcm_writer.float2pcm(snd, out=pcm[i - n_warmup])
+    return pcm, codec.get_state()
+
+
+def shard_checkpoint_name(checkpoint_dir, in_file_name, out_file_name, shard_no,
+        shard_frames, overlap, seed):
+    """Return file name of checkpoint of finished shard. Name contains hash
+    of input file (path, size and modification time) and of parameters
+    changing shards, so decoding with other parameters does not resume
+    from it."""
+    st = os.stat(in_file_name)
+    key = repr((os.path.abspath(in_file_name), st.st_size, st.st_mtime_ns,
+        shard_frames, overlap, seed))
+    return os.path.join(checkpoint_dir, '%s.%s.%06d.pickle' % (
+        os.path.basename(out_file_name), hashlib.sha1(key.encode()).hexdigest()[:16],
+        shard_no))
+
+
+def decode_file_sharded(in_file_name, out_file_name, jobs=1, shard_frames=3000,
+        overlap=10, seed=0, checkpoint_dir=None):
+    """Split stream into shards of shard_frames frames and decode them in
+    parallel, each shard is warmed up by overlap frames preceding it, so
+    output differs from serial decoding only slightly at shard boundaries.
+    If overlap is None shards are decoded one by one from exact codec state.
+    Finished shards are saved into checkpoint_dir, interrupted decoding
+    then continues by missing shards only. Returns number of frames."""
+    if frame_container.is_container(in_file_name):
+        container = frame_container.FrameContainer(in_file_name)
+        container.check_single_stream()
+        frames = [bytes(data) for data in container.frames()]
+    else:
+        with frame_log.open_log(in_file_name) as in_file:
+            frames = [data for batch in frame_log.iter_voice_frame_batches(in_file)
+                    for data in batch]
+    firsts = range(0, len(frames), shard_frames)
+
+    def checkpoint_name(shard_no):
+        if checkpoint_dir is None:
+            return None
+        return shard_checkpoint_name(checkpoint_dir, in_file_name, out_file_name,
+                shard_no, shard_frames, overlap, seed)
+
+    def has_checkpoint(shard_no):
+        file_name = checkpoint_name(shard_no)
+        return file_name is not None and os.path.exists(file_name)
+
+    def load_checkpoint(shard_no):
+        if not has_checkpoint(shard_no):
+            return None
+        file_name = checkpoint_name(shard_no)
+        with open(file_name, 'rb') as f:
+            return pickle.load(f)
+
+    def save_checkpoint(shard_no, result):
+        file_name = checkpoint_name(shard_no)
+        if file_name is None:
             return
-        return unhexlify(j['value'])
+        with open(file_name + '.tmp', 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(file_name + '.tmp', file_name)
 
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    out_file = pcm_writer.open_pcm(out_file_name, n_samples=160*len(frames),
+            samp_rate=Codec.samp_rate)
+    try:
+        if overlap is None:
+            state = None
+            for shard_no, first in enumerate(firsts):
+                result = load_checkpoint(shard_no)
+                if result is None:
+                    result = decode_shard(frames[first:first + shard_frames], first,
+                            seed=seed, state=state)
+                    save_checkpoint(shard_no, result)
+                pcm, state = result
+                out_file.write_pcm(pcm.ravel())
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {}
+                for shard_no, first in enumerate(firsts):
+                    if has_checkpoint(shard_no):
+                        continue
+                    n_warmup = min(overlap, first)
+                    futures[shard_no] = executor.submit(decode_shard,
+                            frames[first - n_warmup:first + shard_frames], first,
+                            n_warmup, seed)
+                for shard_no in range(len(firsts)):
+                    if shard_no in futures:
+                        result = futures[shard_no].result()
+                        save_checkpoint(shard_no, result)
+                    else:
+                        result = load_checkpoint(shard_no)
+                    out_file.write_pcm(result[0].ravel())
+    finally:
+        out_file.close()
 
-if __name__ == '__main__':
-    in_file = sys.argv[1]
-    out_file = sys.argv[2]
+    for shard_no in range(len(firsts)):
+        if has_checkpoint(shard_no):
+            os.remove(checkpoint_name(shard_no))
+    return len(frames)
 
-    voice_decoder = VoiceDecoder(out_file)
-    in_file = open(in_file, 'rt')
-    for j in in_file:
-        voice_decoder.decode_frame(j)
 
-    del voice_decoder
+def decode_files_sharded(files, jobs=1, **kwargs):
+    """Decode files one by one by decode_file_sharded(), shards of each file
+    are spread over jobs worker processes. Returns results in the same
+    form as decode_files()."""
+    results = []
+    for in_file_name, out_file_name in files:
+        start = time.perf_counter()
+        try:
+            n_frames = decode_file_sharded(in_file_name, out_file_name, jobs=jobs,
+                    **kwargs)
+            error = None
+        except Exception as e:
+            n_frames = 0
+            error = '%s: %s' % (type(e).__name__, e)
+        results.append((in_file_name, out_file_name, n_frames,
+            time.perf_counter() - start, error))
+    return results
+
+
+def dir_files(in_dir, out_dir):
+    """Return (in_file_name, out_file_name) pairs for all frame logs in in_dir."""
+    files = []
+    for name in sorted(os.listdir(in_dir)):
+        base = name
+        for ext in ('.gz', '.zst', ):
+            if base.endswith(ext):
+                base = base[:-len(ext)]
+        for ext in ('.json', '.rpf', ):
+            if base.endswith(ext):
+                files.append((os.path.join(in_dir, name),
+                    os.path.join(out_dir, base[:-len(ext)] + '.wav')))
+    return files
+
+
+def print_summary(results, duration, out=sys.stderr):
+    n_frames = sum(r[2] for r in results)
+    errors = [r for r in results if r[4] is not None]
+    for in_file_name, out_file_name, _, _, error in errors:
+        print("%s: %s" % (in_file_name, error), file=out)
+    print("files: %d, frames: %d, errors: %d, time: %.3f s, %.1f frames/sec" %
+            (len(results), n_frames, len(errors), duration,
+                n_frames / duration if duration else 0.), file=out)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+            description='Decode VOICE frames from JSON frame logs into audio files.')
+    parser.add_argument('files', nargs='*', metavar='IN:OUT',
+            help='frame log (JSON lines or frame container) and output file '
+                '(.wav or raw PCM) names, '
+                'legacy form IN OUT is accepted')
+    parser.add_argument('--dir', nargs=2, metavar=('IN_DIR', 'OUT_DIR'),
+            help='decode all *.json[.gz|.zst] and *.rpf files from IN_DIR into OUT_DIR')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help='number of worker processes')
+    parser.add_argument('--shard-frames', type=int, default=None,
+            help='split each stream into shards of this number of frames '
+                'decoded in parallel')
+    parser.add_argument('--overlap', type=int, default=10,
+            help='number of frames used to warm up codec state of shard')
+    parser.add_argument('--exact', action='store_true',
+            help='decode shards one by one from exact codec state')
+    parser.add_argument('--seed', type=int, default=0,
+            help='excitation noise seed of sharded and pipeline decoding')
+    parser.add_argument('--checkpoint', metavar='DIR',
+            help='save finished shards into DIR and resume from them')
+    parser.add_argument('--start', type=float, default=None, metavar='SECONDS',
+            help='decode frames from this timestamp, frame container input only')
+    parser.add_argument('--end', type=float, default=None, metavar='SECONDS',
+            help='decode frames up to this timestamp, frame container input only')
+    parser.add_argument('--pipeline', action='store_true',
+            help='decode by parser, JOBS decode worker and writer processes '
+                'connected by shared memory rings')
+    parser.add_argument('--profile', nargs='?', const='json',
+            choices=('json', 'prometheus', ),
+            help='print time spent in decoding stages to stderr as JSON '
+                '(default) or Prometheus text, sharded decoding is not profiled')
+    args = parser.parse_args(argv)
+
+    if len(args.files) == 2 and all(':' not in f for f in args.files):
+        files = [tuple(args.files)]
+    else:
+        files = []
+        for f in args.files:
+            if ':' not in f:
+                parser.error('Invalid file pair: %s' % f)
+            files.append(tuple(f.rsplit(':', 1)))
+    if args.dir:
+        os.makedirs(args.dir[1], exist_ok=True)
+        files.extend(dir_files(*args.dir))
+    if not files:
+        parser.error('No files to decode')
+    if args.pipeline and (args.shard_frames is not None or args.profile or
+            args.start is not None or args.end is not None):
+        parser.error('--pipeline can not be combined with sharding, time range '
+                'or profiling')
+    return files, args
+
+
+if __name__ == '__main__':
+    files, args = parse_args(sys.argv[1:])
 
+    start = time.perf_counter()
+    profiler = Profiler() if args.profile else None
+    if args.pipeline:
+        import shm_pipeline
+        results = shm_pipeline.decode_files_pipeline(files, workers=args.jobs,
+                seed=args.seed)
+    elif args.shard_frames is None:
+        results = decode_files(files, jobs=args.jobs, profiler=profiler,
+                start_time=args.start, end_time=args.end)
+    else:
+        results = decode_files_sharded(files, jobs=args.jobs,
+                shard_frames=args.shard_frames,
+                overlap=None if args.exact else args.overlap,
+                seed=args.seed, checkpoint_dir=args.checkpoint)
+    print_summary(results, time.perf_counter() - start)
+    if profiler is not None:
+        profiler.dump(args.profile)
+    if any(r[4] is not None for r in results):
+        sys.exit(1)
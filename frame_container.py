@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""Compact binary container of VOICE frames.
+
+File starts with 16 bytes header (magic, version, record size), followed
+by fixed size records (timestamp, frame number, stream ID, 15 bytes of
+frame data). Footer contains sparse index of (timestamp, record number)
+and 32 bytes trailer (number of records, index offset, number of index
+entries, magic). All numbers are little endian."""
+
+import frame_log
+import json
+import numpy as np
+import struct
+import sys
+
+
+magic = b'RPCF'
+trailer_magic = b'RPCX'
+version = 1
+frame_len = 15
+header_format = '<4sHH8x'
+header_len = struct.calcsize(header_format)
+trailer_format = '<QQQ4s4x'
+trailer_len = struct.calcsize(trailer_format)
+
+record_dtype = np.dtype([
+    ('timestamp', '<f8'),
+    ('frame_no', '<u4'),
+    ('stream_id', '<u2'),
+    ('data', 'u1', (frame_len, )),
+    ])
+index_dtype = np.dtype([('timestamp', '<f8'), ('record', '<u8')])
+
+# duration of one frame in seconds
+frame_duration = 160 / 8000
+
+
+def is_container(file_name):
+    """Return True if file_name is frame container."""
+    try:
+        with open(file_name, 'rb') as f:
+            return f.read(len(magic)) == magic
+    except OSError:
+        return False
+
+
+class FrameContainer:
+    """Read-only access to frame container, file is memory mapped and
+    frames are returned as zero-copy slices."""
+    def __init__(self, file_name):
+        self.buf = np.memmap(file_name, dtype=np.uint8, mode='r')
+        if len(self.buf) < header_len + trailer_len:
+            raise ValueError('Truncated frame container: %s' % file_name)
+        file_magic, file_version, record_size = struct.unpack(header_format,
+                self.buf[:header_len].tobytes())
+        n_records, index_offset, n_index, file_trailer_magic = struct.unpack(
+                trailer_format, self.buf[-trailer_len:].tobytes())
+        if file_magic != magic or file_trailer_magic != trailer_magic:
+            raise ValueError('Not a frame container: %s' % file_name)
+        if file_version != version or record_size != record_dtype.itemsize:
+            raise ValueError('Unsupported frame container version: %d' % file_version)
+        end = header_len + n_records * record_size
+        self.records = self.buf[header_len:end].view(record_dtype)
+        self.index = self.buf[index_offset:index_offset + n_index *
+                index_dtype.itemsize].view(index_dtype)
+        self.view = memoryview(self.buf)
+
+    def __len__(self):
+        return len(self.records)
+
+    def frame(self, i):
+        """Return memoryview of data of i-th frame."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Frame index out of range')
+        offs = header_len + i * record_dtype.itemsize + record_dtype.fields['data'][1]
+        return self.view[offs:offs + frame_len]
+
+    def frames(self, start=0, stop=None):
+        """Yield memoryviews of data of frames start..stop-1."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        for i in range(start, stop):
+            yield self.frame(i)
+
+    def data(self, start=0, stop=None):
+        """Return (n, 15) uint8 array view of frames data."""
+        return self.records['data'][start:stop]
+
+    def check_single_stream(self, start=0, stop=None):
+        """Raise ValueError if records start..stop-1 belong to more than one
+        stream, codec state can't be shared by frames of several streams."""
+        stream_ids = self.records['stream_id'][start:stop]
+        if len(stream_ids) and (stream_ids != stream_ids[0]).any():
+            raise ValueError('Frame container with several streams is not supported')
+
+    def find_time(self, timestamp):
+        """Return number of the first record with timestamp >= timestamp.
+        Sparse index narrows the range, only small part of records is searched."""
+        lo, hi = 0, len(self)
+        if len(self.index):
+            i = np.searchsorted(self.index['timestamp'], timestamp, side='left')
+            if i > 0:
+                lo = int(self.index['record'][i - 1])
+            if i < len(self.index):
+                hi = int(self.index['record'][i])
+        return lo + int(np.searchsorted(self.records['timestamp'][lo:hi],
+            timestamp, side='left'))
+
+
+def write_container(out_file_name, frames, index_step=3000):
+    """Write frames into container. frames is iterable of (timestamp,
+    frame_no, stream_id, data) tuples in order of timestamps, data shorter
+    than 15 bytes and decreasing timestamps are rejected, longer data is
+    truncated. Every index_step-th record is added into index. Returns number
+    of frames."""
+    index = []
+    n_records = 0
+    last_timestamp = -np.inf
+    rec = np.zeros(1, dtype=record_dtype)
+    with open(out_file_name, 'wb') as f:
+        f.write(struct.pack(header_format, magic, version, record_dtype.itemsize))
+        for timestamp, frame_no, stream_id, data in frames:
+            if len(data) < frame_len:
+                raise ValueError('VOICE frame %d is too short' % frame_no)
+# find_time() relies on ordered timestamps
+            if timestamp < last_timestamp:
+                raise ValueError('Timestamp of frame %d decreases' % frame_no)
+            last_timestamp = timestamp
+            if n_records % index_step == 0:
+                index.append((timestamp, n_records))
+            rec['timestamp'] = timestamp
+            rec['frame_no'] = frame_no
+            rec['stream_id'] = stream_id
+            rec['data'] = np.frombuffer(data, dtype=np.uint8, count=frame_len)
+            f.write(rec.tobytes())
+            n_records += 1
+        index_offset = f.tell()
+        f.write(np.array(index, dtype=index_dtype).tobytes())
+        f.write(struct.pack(trailer_format, n_records, index_offset, len(index),
+            trailer_magic))
+    return n_records
+
+
+def iter_log_frames(f, stream_id=0):
+    """Yield (timestamp, frame_no, stream_id, data) of VOICE frames from JSON
+    lines frame log. Timestamp is 'time' of row if present, otherwise
+    position of frame in decoded audio."""
+    n = 0
+    for line in f:
+        if b'"VOICE"' not in line or b'"hex"' not in line:
+            continue
+        j = json.loads(line)
+        data = frame_log.get_voice_data(j)
+        if not data:
+            continue
+        timestamp = j.get('time', n * frame_duration)
+        yield (timestamp, j.get('frame_no', n), j.get('stream_id', stream_id), data)
+        n += 1
+
+
+def convert(in_file_name, out_file_name, stream_id=0, index_step=3000):
+    """Convert JSON lines frame log into container, return number of frames."""
+    with frame_log.open_log(in_file_name) as f:
+        return write_container(out_file_name, iter_log_frames(f, stream_id),
+                index_step=index_step)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: %s IN.json[.gz|.zst] OUT.rpf' % sys.argv[0], file=sys.stderr)
+        sys.exit(1)
+    print('frames: %d' % convert(sys.argv[1], sys.argv[2]), file=sys.stderr)
@@ -0,0 +1,137 @@
+from binascii import unhexlify
+import gzip
+import io
+import json
+import numpy as np
+import sys
+
+
+# plain file read buffer size
+buffer_size = 1 << 20
+
+# length of VOICE frame data, see VoiceFrame
+voice_frame_len = 15
+
+gzip_magic = b'\x1f\x8b'
+zstd_magic = b'\x28\xb5\x2f\xfd'
+
+
+def open_log(file_name=None):
+    """Open JSON lines frame log for binary reading, gzip and zstd compressed
+    logs are decompressed transparently. None or '-' stands for stdin."""
+    if file_name is None or file_name == '-':
+        f = sys.stdin.buffer
+    else:
+        f = open(file_name, 'rb', buffering=buffer_size)
+    return decompress(f)
+
+
+class GzipReader(gzip.GzipFile):
+    """GzipFile reading from file object, which is closed with it."""
+    def __init__(self, f):
+        super().__init__(fileobj=f)
+        self.raw_file = f
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.raw_file.close()
+
+
+class PrefixReader(io.RawIOBase):
+    """Raw reader returning prefix bytes followed by data of file object f,
+    which is closed with it."""
+    def __init__(self, prefix, f):
+        self.prefix = prefix
+        self.f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.prefix:
+            return self.f.readinto(b)
+        n = min(len(b), len(self.prefix))
+        b[:n] = self.prefix[:n]
+        self.prefix = self.prefix[n:]
+        return n
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.f.close()
+
+
+def decompress(f):
+    """Wrap buffered binary file into decompressor if compressed data is
+    detected. Closing of returned file closes also f."""
+    magic = f.peek(4)[:4]
+    if len(magic) < 4:
+# pipe can return fewer bytes than peeked for, magic is read and put back
+        magic = b''
+        while len(magic) < 4:
+            data = f.read(4 - len(magic))
+            if not data:
+                break
+            magic += data
+        f = io.BufferedReader(PrefixReader(magic, f), buffer_size=buffer_size)
+    if magic.startswith(gzip_magic):
+        return io.BufferedReader(GzipReader(f), buffer_size=buffer_size)
+    if magic == zstd_magic:
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+        return io.BufferedReader(reader, buffer_size=buffer_size)
+    return f
+
+
+def get_voice_frame(json_row):
+    """Return VOICE frame data or None. json_row can be str or bytes."""
+    return get_voice_data(json.loads(json_row))
+
+
+def get_voice_data(j):
+    """Return VOICE frame data of parsed JSON row or None."""
+    if j['event'] != 'frame':
+        return
+    j = j['frame']
+    if j['type'] != 'VOICE':
+        return
+    j = j['data']
+    if j['encoding'] != 'hex':
+        return
+    return unhexlify(j['value'])
+
+
+def iter_voice_frames(f):
+    """Yield VOICE frame data from JSON lines binary file. Lines which can't
+    be VOICE frame are skipped without JSON parsing."""
+    for line in f:
+        if b'"VOICE"' not in line or b'"hex"' not in line:
+            continue
+        frame = get_voice_frame(line)
+        if frame:
+            yield frame
+
+
+def voice_frames2array(frames):
+    """Return (N, 15) uint8 array of list of N VOICE frames data, bytes
+    after the first 15 are ignored. Raises ValueError for shorter frame."""
+    for frame in frames:
+        if len(frame) < voice_frame_len:
+            raise ValueError('VOICE frame is too short: %s' % frame.hex())
+    data = b''.join(frame[:voice_frame_len] for frame in frames)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, voice_frame_len)
+
+
+def iter_voice_frame_batches(f, batch_size=1024):
+    """Yield lists of up to batch_size VOICE frames data."""
+    batch = []
+    for frame in iter_voice_frames(f):
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
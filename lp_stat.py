@@ -1,49 +1,142 @@
 #!/usr/bin/env python3
 
+from profiling import Profiler, null_profiler
 from rp_celp import Codec
-from struct import unpack
+import argparse
 import numpy as np
+import os
 import sys
 
 
 class LPStat:
-    def __init__(self, in_file_name):
-        """in_file_name should contain 16 bit mono audio with range +-(2**12-1)."""
+    """Histograms of LAR indexes of encoded audio, updated incrementally.
+    If profile is True, stages of encoding are timed by self.profiler."""
+    n_bins = max(len(l) for l in Codec.LAR_idx)
+
+    def __init__(self, profile=False):
+        self.counts = np.zeros((len(Codec.LAR_idx), LPStat.n_bins), dtype=np.int64)
+        self.n_frames = 0
+        self.profiler = Profiler() if profile else null_profiler
+
+    def add_frames(self, lar_idx):
+        """Add (N, 10) array of LAR indexes into histograms."""
+        with self.profiler.stage('histogram', len(lar_idx)):
+            for i in range(len(self.counts)):
+                self.counts[i] += np.bincount(lar_idx[:, i], minlength=LPStat.n_bins)
+        self.n_frames += len(lar_idx)
+
+    def add_file(self, in_file_name, batch_frames=4096, max_frames=None):
+        """in_file_name should contain 16 bit mono audio with range +-(2**12-1).
+        File is encoded in batches of batch_frames frames, see
+        iter_sample_batches()."""
         codec = Codec()
-        n = 1000000
-        v = [[], [], [], [], [], [], [], [], [], []]
-        with open(in_file_name, 'rb') as f:
-            while True:
-                n -= 1
-                if n <= 0:
-                    break
-                frame = f.read(2*160)
-                if len(frame) != 2*160:
-                    break
-                frame = unpack('h'*160, frame)
-                cframe = codec.encode(frame)
-                for i in range(10):
-                    v[i].append(cframe[i])
-
-        hists = []
-        for vn in v:
-            hists.append(np.histogram(vn, bins=32, range=(0, 32), density=False))
+        codec.profiler = self.profiler
+        for samples in iter_sample_batches(in_file_name, batch_frames, max_frames):
+            self.add_frames(codec.encode_frames(samples))
+
+    def merge(self, lp_stat):
+        """Add histograms collected by other LPStat."""
+        self.counts += lp_stat.counts
+        self.n_frames += lp_stat.n_frames
+        self.profiler.merge(lp_stat.profiler)
 
+    def print_csv(self, out=sys.stdout):
         # values in first row
-        print(",", end='')
-        val = hists[0][1]
-        for v in val:
-            print("%f," % v, end='')
-        print()
+        print(",", end='', file=out)
+        for v in range(LPStat.n_bins + 1):
+            print("%f," % v, end='', file=out)
+        print(file=out)
+
+        for i in range(len(self.counts)):
+            print("%d," % i, end='', file=out)
+            for c in self.counts[i]:
+                print("%d," % c, end='', file=out)
+            print(file=out)
+        print(file=out)
+
+    def save_npz(self, file_name):
+        np.savez(file_name, counts=self.counts, n_frames=self.n_frames,
+                bin_edges=np.arange(LPStat.n_bins + 1))
+
 
-        for i in range(len(hists)):
-            print("%d," % i, end='')
-            cnt = hists[i][0]
-            for c in cnt:
-                print("%d," % c, end='')
-            print()
-        print()
+def iter_sample_batches(in_file_name, batch_frames=4096, max_frames=None):
+    """Yield (n, 160) int16 arrays of up to batch_frames frames of file.
+    Regular file is memory mapped, other files (pipes) are read by chunks."""
+    if os.path.isfile(in_file_name):
+        n_frames = os.path.getsize(in_file_name) // (2*160)
+        if max_frames is not None:
+            n_frames = min(n_frames, max_frames)
+        if not n_frames:
+            return
+        samples = np.memmap(in_file_name, dtype=np.int16, mode='r',
+                shape=(n_frames, 160))
+        for i in range(0, n_frames, batch_frames):
+            yield samples[i:i+batch_frames]
+        return
+    with open(in_file_name, 'rb') as f:
+        while max_frames is None or max_frames > 0:
+            n = batch_frames if max_frames is None else min(batch_frames, max_frames)
+            data = f.read(2*160 * n)
+            samples = np.frombuffer(data, dtype=np.int16,
+                    count=len(data) // (2*160) * 160).reshape(-1, 160)
+            if not len(samples):
+                return
+            yield samples
+            if max_frames is not None:
+                max_frames -= len(samples)
+
+
+def file_stat(in_file_name, batch_frames=4096, max_frames=None, profile=False):
+    """Return LPStat of single file, used by worker processes."""
+    lp_stat = LPStat(profile=profile)
+    lp_stat.add_file(in_file_name, batch_frames=batch_frames, max_frames=max_frames)
+    return lp_stat
+
+
+def files_stat(in_file_names, jobs=1, batch_frames=4096, max_frames=None,
+        profile=False):
+    """Return LPStat merged from all files, files are processed by jobs
+    worker processes."""
+    lp_stat = LPStat(profile=profile)
+    if jobs == 1:
+        for in_file_name in in_file_names:
+            lp_stat.add_file(in_file_name, batch_frames=batch_frames,
+                    max_frames=max_frames)
+        return lp_stat
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(file_stat, in_file_name, batch_frames, max_frames,
+            profile)
+                for in_file_name in in_file_names]
+        for future in futures:
+            lp_stat.merge(future.result())
+    return lp_stat
 
 
 if __name__ == '__main__':
-    lp_stat = LPStat(sys.argv[1])
+    parser = argparse.ArgumentParser(
+            description='Histograms of LAR indexes of 16 bit PCM files.')
+    parser.add_argument('files', nargs='+', help='16 bit mono PCM files')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help='number of worker processes')
+    parser.add_argument('--batch', type=int, default=4096,
+            help='number of frames encoded at once')
+    parser.add_argument('--max-frames', type=int, default=None,
+            help='maximal number of frames read from each file')
+    parser.add_argument('--npz', metavar='FILE',
+            help='save histograms into NPZ file instead of printing CSV')
+    parser.add_argument('--profile', nargs='?', const='json',
+            choices=('json', 'prometheus', ),
+            help='print time spent in encoding stages to stderr as JSON '
+                '(default) or Prometheus text')
+    args = parser.parse_args()
+
+    lp_stat = files_stat(args.files, jobs=args.jobs, batch_frames=args.batch,
+            max_frames=args.max_frames, profile=bool(args.profile))
+    if args.npz:
+        lp_stat.save_npz(args.npz)
+    else:
+        lp_stat.print_csv()
+    if args.profile:
+        lp_stat.profiler.dump(args.profile)
@@ -0,0 +1,131 @@
+from profiling import null_profiler
+import numpy as np
+import struct
+import wave
+
+
+def float2pcm(samples, out=None):
+    """Convert samples in range <-1, 1> to 16 bit little endian PCM."""
+    pcm = np.rint(np.asarray(samples) * 32767)
+    np.clip(pcm, -32768, 32767, out=pcm)
+    if out is None:
+        return pcm.astype('<i2')
+    out[...] = pcm
+    return out
+
+
+def wav_header(n_samples, samp_rate=8000):
+    """Return 44 bytes header of 16 bit mono WAV file."""
+    data_len = 2 * n_samples
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_len, b'WAVE',
+            b'fmt ', 16, 1, 1, samp_rate, 2 * samp_rate, 2, 16, b'data', data_len)
+
+
+class PCMWriter:
+    """Write decoded audio as WAV or raw 16 bit PCM file. Samples are
+    converted into preallocated buffer and written in blocks."""
+    profiler = null_profiler
+
+    def __init__(self, file_name, raw=False, samp_rate=8000, block_len=160*256):
+        if raw:
+            self.f = open(file_name, 'wb')
+        else:
+            self.f = wave.open(file_name, 'wb')
+            self.f.setnchannels(1)
+            self.f.setsampwidth(2)
+            self.f.setframerate(samp_rate)
+        self.raw = raw
+        self.buf = np.empty(block_len, dtype='<i2')
+        self.pos = 0
+
+    def write(self, samples):
+        """Write samples in range <-1, 1>, any shape is accepted."""
+        samples = np.ravel(samples)
+        while len(samples):
+            n = min(len(samples), len(self.buf) - self.pos)
+            with self.profiler.stage('pcm_pack'):
+                float2pcm(samples[:n], out=self.buf[self.pos:self.pos + n])
+            self.pos += n
+            samples = samples[n:]
+            if self.pos == len(self.buf):
+                self.flush()
+
+    def write_pcm(self, pcm):
+        """Write already converted 16 bit samples."""
+        self.flush()
+        data = np.asarray(pcm, dtype='<i2').tobytes()
+        if self.raw:
+            self.f.write(data)
+        else:
+            self.f.writeframes(data)
+
+    def flush(self):
+        with self.profiler.stage('write'):
+            data = self.buf[:self.pos].tobytes()
+            if self.raw:
+                self.f.write(data)
+            else:
+                self.f.writeframes(data)
+        self.pos = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+class MemmapPCMWriter:
+    """Write decoded audio into memory mapped WAV or raw PCM file preallocated
+    for n_samples. File is truncated on close if less samples are written."""
+    profiler = null_profiler
+
+    def __init__(self, file_name, n_samples, raw=False, samp_rate=8000):
+        self.file_name = file_name
+        self.samp_rate = samp_rate
+        self.offset = 0 if raw else len(wav_header(0))
+        with open(file_name, 'wb') as f:
+            if not raw:
+                f.write(wav_header(n_samples, samp_rate))
+            f.truncate(self.offset + 2 * n_samples)
+        self.mm = None
+        if n_samples:
+            self.mm = np.memmap(file_name, dtype='<i2', mode='r+',
+                    offset=self.offset, shape=(n_samples, ))
+        self.n_samples = n_samples
+        self.pos = 0
+
+    def write(self, samples):
+        """Write samples in range <-1, 1>, any shape is accepted."""
+        samples = np.ravel(samples)
+        if self.pos + len(samples) > self.n_samples:
+            raise ValueError('Preallocated output is full')
+        with self.profiler.stage('pcm_pack'):
+            float2pcm(samples, out=self.mm[self.pos:self.pos + len(samples)])
+        self.pos += len(samples)
+
+    def write_pcm(self, pcm):
+        """Write already converted 16 bit samples."""
+        if self.pos + len(pcm) > self.n_samples:
+            raise ValueError('Preallocated output is full')
+        self.mm[self.pos:self.pos + len(pcm)] = pcm
+        self.pos += len(pcm)
+
+    def close(self):
+        if self.mm is not None:
+            with self.profiler.stage('write'):
+                self.mm.flush()
+            self.mm = None
+        if self.pos == self.n_samples:
+            return
+        with open(self.file_name, 'r+b') as f:
+            if self.offset:
+                f.write(wav_header(self.pos, self.samp_rate))
+            f.truncate(self.offset + 2 * self.pos)
+
+
+def open_pcm(file_name, n_samples=None, samp_rate=8000):
+    """Open PCM writer, files with .wav extension are written as WAV, other
+    as raw 16 bit PCM. If n_samples is known output is memory mapped."""
+    raw = not file_name.lower().endswith('.wav')
+    if n_samples is None:
+        return PCMWriter(file_name, raw=raw, samp_rate=samp_rate)
+    return MemmapPCMWriter(file_name, n_samples, raw=raw, samp_rate=samp_rate)
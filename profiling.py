@@ -0,0 +1,110 @@
+from bisect import bisect_left
+import contextlib
+import json
+import sys
+import time
+
+
+class StageTimer:
+    """Context manager measuring one execution of stage."""
+    __slots__ = ('profiler', 'name', 'items', 'start', )
+
+    def __init__(self, profiler, name, items):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start, self.items)
+
+
+class Profiler:
+    """Counters and latency histograms of named processing stages.
+    Use as: with profiler.stage('name'): ...
+    Stage processing batch of frames should pass number of frames as items."""
+# upper bounds of histogram buckets in seconds, 1 us .. 8 s
+    buckets = tuple(1e-6 * 2**i for i in range(24))
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name, items=1):
+        return StageTimer(self, name, items)
+
+    def add(self, name, duration, items=1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'items': 0, 'seconds': 0.,
+                    'histogram': [0, ] * (len(Profiler.buckets) + 1)}
+        stage['calls'] += 1
+        stage['items'] += items
+        stage['seconds'] += duration
+        stage['histogram'][bisect_left(Profiler.buckets, duration)] += 1
+
+    def merge(self, profiler):
+        """Add counters collected by other Profiler (e.g. in worker process)."""
+        for name, other in profiler.stages.items():
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = {k: (list(v) if isinstance(v, list) else v)
+                        for k, v in other.items()}
+                continue
+            for k in ('calls', 'items', 'seconds', ):
+                stage[k] += other[k]
+            stage['histogram'] = [a + b for a, b in
+                    zip(stage['histogram'], other['histogram'])]
+
+    def to_dict(self):
+        return {'buckets': list(Profiler.buckets), 'stages': self.stages}
+
+    def dump_json(self, out=sys.stderr):
+        json.dump(self.to_dict(), out, indent=1)
+        print(file=out)
+
+    def dump_prometheus(self, out=sys.stderr, prefix='rp_celp_stage'):
+        """Write counters in Prometheus text exposition format."""
+        print("# TYPE %s_items_total counter" % prefix, file=out)
+        for name, stage in self.stages.items():
+            print('%s_items_total{stage="%s"} %d' % (prefix, name, stage['items']),
+                    file=out)
+        print("# TYPE %s_seconds histogram" % prefix, file=out)
+        for name, stage in self.stages.items():
+            n = 0
+            for le, count in zip(Profiler.buckets, stage['histogram']):
+                n += count
+                print('%s_seconds_bucket{stage="%s",le="%g"} %d' %
+                        (prefix, name, le, n), file=out)
+            print('%s_seconds_bucket{stage="%s",le="+Inf"} %d' %
+                    (prefix, name, stage['calls']), file=out)
+            print('%s_seconds_sum{stage="%s"} %.9f' % (prefix, name, stage['seconds']),
+                    file=out)
+            print('%s_seconds_count{stage="%s"} %d' % (prefix, name, stage['calls']),
+                    file=out)
+
+    def dump(self, fmt='json', out=sys.stderr):
+        if fmt == 'prometheus':
+            self.dump_prometheus(out)
+        else:
+            self.dump_json(out)
+
+
+class NullProfiler:
+    """Profiler doing nothing, used when profiling is off."""
+    stages = {}
+    null_stage = contextlib.nullcontext()
+
+    def stage(self, name, items=1):
+        return NullProfiler.null_stage
+
+    def add(self, name, duration, items=1):
+        pass
+
+    def merge(self, profiler):
+        pass
+
+
+null_profiler = NullProfiler()
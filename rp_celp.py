@@ -1,6 +1,74 @@
+from functools import lru_cache
+from profiling import null_profiler
 import numpy as np
-import scipy.signal
-from bisect import bisect_left
+# scipy takes several times longer to import than numpy, it is imported
+# by methods which need it (encoder, 'lfilter' backend)
+
+
+class LARQuantizer:
+    """LAR quantization tables prepared for vectorized lookup."""
+# interpolation weights of previous and current LARs for 3 subframes
+    interpolation = np.array(((0.875, 0.125), (0.500, 0.500), (0.125, 0.875), ))
+
+    def __init__(self, levels):
+        self.sizes = np.array([len(l) for l in levels])
+        self.levels = np.zeros((len(levels), max(self.sizes)))
+        for i, l in enumerate(levels):
+            self.levels[i, :len(l)] = l
+# decision thresholds (midpoints between levels) of all tables shifted
+# into disjoint ranges, so one searchsorted() quantizes all coefficients
+        self.lar_max = 4.
+        self.offsets = 3 * self.lar_max * np.arange(len(levels))
+        self.thresholds = np.concatenate([(l[1:] + l[:-1]) / 2 + offs
+            for l, offs in zip(levels, self.offsets)])
+        self.starts = np.concatenate(((0, ), np.cumsum(self.sizes - 1)[:-1]))
+# offsets of tables in flattened levels
+        self.row_offsets = self.levels.shape[1] * np.arange(len(levels))
+# weights of previous and current LARs for each coefficient of (3, 10)
+# subframe LARs, same shape operands avoid broadcasting temporaries
+        self.w_old, self.w_new = np.repeat(LARQuantizer.interpolation.T[:, :, None],
+                len(levels), axis=2)
+# interpolation weights in eighths for fixed point
+        self.interpolation8 = (8 * LARQuantizer.interpolation).astype(np.int32)
+
+    def quantize(self, lars):
+        """Return indexes of nearest levels, works over last axis of lars."""
+        lars = np.clip(lars, -self.lar_max, self.lar_max)
+        return np.searchsorted(self.thresholds, lars + self.offsets) - self.starts
+
+    def dequantize(self, lar_idx, out=None):
+        """Return quantized LARs for indexes, works over last axis of lar_idx."""
+        return np.take(self.levels.ravel(), self.row_offsets + lar_idx, out=out)
+
+    def interpolate_refl_coefs(self, old_lars, lars, approx, precision='float64',
+            out=None):
+        """Return (3, 10) array of reflection coefficients of subframes
+        interpolated from previous (None for the first frame) and current
+        quantized LARs. Coefficients are float64, float32 or Q15 int16
+        (fixed) as selected by precision. Float coefficients are computed
+        in out and scratch arrays (both (3, 10) float64) if out is given as
+        their tuple."""
+        if precision == 'fixed':
+            lars = Codec.lars2fixed(lars)
+            if old_lars is None:
+                lars3 = np.array((lars, lars, lars))
+            else:
+                old_lars = Codec.lars2fixed(old_lars).astype(np.int32)
+                w = self.interpolation8
+                lars3 = (w[:, 0, None]*old_lars + w[:, 1, None]*lars + 4) >> 3
+            return Codec.lar2refl_coef_fixed(lars3)
+        refl_coefs, lars3 = (np.empty((3, 10)), np.empty((3, 10))) if out is None else out
+        lars3[...] = lars
+        if old_lars is not None:
+            lars3 *= self.w_new
+            refl_coefs[...] = old_lars
+            refl_coefs *= self.w_old
+            lars3 += refl_coefs
+        if approx:
+            refl_coefs = Codec.lar2refl_coef_approx(lars3, out=refl_coefs)
+        else:
+            refl_coefs = Codec.lar2refl_coef_eval(lars3, out=refl_coefs)
+        return refl_coefs.astype(precision, copy=False)
 
 
 class Codec:
@@ -24,6 +92,8 @@ class Codec:
             np.linspace(-0.3206912, 0.55081164, 8),
             )
 
+    quantizer = LARQuantizer(LAR_idx)
+
     # Quantization Gain values for indexes 0..31
     QLBG = (0, 5, 11, 19, 27, 35, 43, 51, 59, 71, 87, 103, 119, 143, 175, 207,
             239, 287, 351, 415, 479, 575, 703, 831, 959, 1151, 1407, 1663,
@@ -33,146 +103,575 @@ class Codec:
 # size of subframes
     N = (56, 48, 56)
 
-    def __init__(self, approx=True):
+# names of LAR indexes and subframe gains in VoiceFrame record
+    lar_fields = tuple('LAR%02d' % i for i in range(1, 11))
+    gain_fields = ('stochastic_gain1', 'stochastic_gain2', 'stochastic_gain3', )
+
+# short term filter implementations, see short_term_analysis_filtering()
+    filter_backends = ('python', 'lfilter', )
+
+# subframe parameters search, see search_subframes()
+# LTP lag code is lag - ltp_lag_min (8 bits)
+    ltp_lag_min = 20
+    ltp_lag_max = ltp_lag_min + 255
+# LTP gain for 3 bits code
+    ltp_gains = np.array((0., 0.2, 0.4, 0.55, 0.7, 0.85, 1.0, 1.15))
+# regular pulse spacing for stN_dec code and size of stN_sig_ph code
+# (phase and signs of pulses) of subframes, see VoiceFrame.coeffs
+    rp_spacing = (3, 4, 5, 6, )
+    st_sig_ph_bits = (10, 9, 9, )
+# number of candidates passed from coarse to exact evaluation
+    ltp_candidates = 4
+    st_candidates = 16
+# stochastic codebooks shared by all instances, indexed by (length, bits)
+    codebooks = {}
+
+# arithmetic of signal path, see __init__()
+    precisions = ('float64', 'float32', 'fixed', )
+# fixed point signals are 16 bit Q15 of float signals multiplied by
+# 2**fixed_shift, decoded speech is quiet and would use only few bits
+    fixed_shift = 6
+
+# excitation noise tables shared by all instances, indexed by seed and precision
+    noise_len = 1600000
+    noise_tables = {}
+    noise_gain = 0.00003
+# low pass filter of noise, scipy.signal.firwin(numtaps=8, cutoff=3000, fs=8000)
+    noise_taps = np.array((0.006673949155627517, -0.012248977939018581,
+        -0.05179314053116593, 0.557368169314557, 0.557368169314557,
+        -0.05179314053116593, -0.012248977939018581, 0.006673949155627517, ))
+
+# per stage timing, set instance attribute to profiling.Profiler() to enable
+    profiler = null_profiler
+
+    def __init__(self, approx=True, filter_backend='python', seed=None,
+            reuse_buffers=False, precision='float64'):
+        """precision selects arithmetic of signal path: 'float64' is the
+        reference, 'float32' halves memory of signals and noise table,
+        'fixed' runs LAR conversions and lattice filters in 16 bit integer
+        arithmetic of GSM 06.10 (requires approx and 'python' backend).
+        LP analysis and subframe search are done in float64 for all."""
+        if filter_backend not in Codec.filter_backends:
+            raise ValueError('Invalid filter backend: %s' % filter_backend)
+        if precision not in Codec.precisions:
+            raise ValueError('Invalid precision: %s' % precision)
+        if precision == 'fixed' and (not approx or filter_backend != 'python'):
+            raise ValueError('Fixed point requires approx and python filter backend')
         self.old_lars = None
         self.approx = approx
+        self.filter_backend = filter_backend
+        self.precision = precision
+# dtype of float signals and returned samples
+        self.dtype = np.dtype(np.float32 if precision == 'float32' else np.float64)
 # required one extra sample from past
-        self.prec = np.zeros(81)
-# decoder, keep history
-        self.v = np.zeros(11)
+        self.prec = np.zeros(81, dtype=self.dtype)
+# decoder, keep history (Q15 integers for fixed point)
+        self.v = np.zeros(11, dtype=np.int16 if precision == 'fixed' else self.dtype)
 # encoder, keep 1 sample from previous frame as initial value for short term filter
         self.s_prev = 0
-# white noise, excitation vector for synthesis filter
-        self.noise = np.clip(np.random.normal(size=(1600000,)), -2.1, 2.1)
-        h = scipy.signal.firwin(numtaps=8, cutoff=3000, nyq=Codec.samp_rate/2)
-        self.noise=scipy.signal.lfilter(h, 1.0, self.noise)
+# encoder, excitation history (the last sample is the most recent) and
+# past outputs of synthesis filter (the most recent first) of subframe search
+        self.exc = np.zeros(Codec.ltp_lag_max)
+        self.syn_mem = np.zeros(10)
+# seed of excitation noise, instance keeps only position in shared table
+        self.seed = seed
         self.noise_offs = 0
-
-    def decode(self, lar_idx, subframe1, subframe2, subframe3):
+# scratch and output arrays allocated once, see work_buffer()
+        self.buffers = {} if reuse_buffers else None
+
+# attributes carrying stream state between frames
+    state_attrs = ('old_lars', 'prec', 's_prev', 'v', 'noise_offs', 'exc',
+            'syn_mem', )
+
+    def get_state(self):
+        """Return picklable snapshot of stream state."""
+        state = {}
+        for attr in Codec.state_attrs:
+            value = getattr(self, attr)
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+            state[attr] = value
+        return state
+
+    def set_state(self, state):
+        """Restore stream state from get_state() snapshot."""
+        for attr in Codec.state_attrs:
+            value = state[attr]
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+            setattr(self, attr, value)
+
+    def work_buffer(self, name, shape, dtype=None):
+        """Return array for intermediate or output values (of self.dtype by
+        default). With reuse_buffers the array is allocated once and returned
+        again by next call (with the same name), so values are valid only
+        until next frame."""
+        dtype = self.dtype if dtype is None else dtype
+        if self.buffers is None:
+            return np.empty(shape, dtype=dtype)
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self.buffers[name] = np.empty(shape, dtype=dtype)
+        return buf
+
+    @staticmethod
+    def noise_offs_at(frame_no):
+        """Return noise_offs before decoding of frame frame_no (counted from 0)
+        of stream, so stream can be decoded from any frame."""
+        if frame_no == 0:
+            return 0
+        return ((frame_no - 1) % (Codec.noise_len // 160 - 1) + 1) * 160
+
+    @property
+    def noise(self):
+        """White noise, excitation vector for synthesis filter."""
+        return Codec.noise_table(self.seed, self.precision)
+
+    @staticmethod
+    def noise_table(seed=None, precision='float64'):
+        """Return read-only noise table, the table is generated on first use
+        and shared within process. Same seed gives same table, None is
+        for table with unpredictable content. Fixed point table holds
+        excitation (noise multiplied by noise_gain) in fixed point signal
+        format, see fixed_shift."""
+        noise = Codec.noise_tables.get((seed, precision))
+        if noise is None:
+# float64 table is kept only when used, other tables are converted from it
+            noise = Codec.noise_tables.get((seed, 'float64'))
+            if noise is None:
+                rng = np.random.default_rng(seed)
+                noise = np.clip(rng.normal(size=(Codec.noise_len, )), -2.1, 2.1)
+                noise = np.convolve(noise, Codec.noise_taps)[:Codec.noise_len]
+            if precision == 'float32':
+                noise = noise.astype(np.float32)
+            elif precision == 'fixed':
+                x = noise * (Codec.noise_gain * 2.**(15 + Codec.fixed_shift))
+                np.rint(x, out=x)
+                noise = np.clip(x, -32768, 32767, out=x).astype(np.int16)
+            noise.flags.writeable = False
+            Codec.noise_tables[(seed, precision)] = noise
+        return noise
+
+    def decode(self, lar_idx, subframe1=None, subframe2=None, subframe3=None,
+            out=None):
         """Get encoded frame, return 160 samples in 13 bit unifor format
-            (16 bit signed int) of decoded audio at rate 8ksampl/sec."""
-        lar_quant = self.lar_idxs2lars(lar_idx)
-        lars3 = self.lar_interpolate(lar_quant)
-        refl_coefs3 = [self.lar2refl_coef(lars) for lars in lars3]
-
-        self.noise_offs += 160
-        if self.noise_offs >= len(self.noise):
-            self.noise_offs = 160
-        d = self.noise[self.noise_offs-160:self.noise_offs] * 0.00003
+            (16 bit signed int) of decoded audio at rate 8ksampl/sec.
+            Frame can be also given as VoiceFrame record (numpy structured
+            scalar) in place of lar_idx, subframes are then taken from it.
+            Samples are written into out if given, with reuse_buffers
+            returned array is overwritten by next decode()."""
+        if isinstance(lar_idx, np.void):
+            lar_idx = tuple(lar_idx[name] for name in Codec.lar_fields)
+        profiler = self.profiler
+        refl_coefs3 = self.lar_idxs2refl_coefs(lar_idx)
+
+        with profiler.stage('noise'):
+            noise = self.noise
+            self.noise_offs += 160
+            if self.noise_offs >= len(noise):
+                self.noise_offs = 160
+            d = noise[self.noise_offs-160:self.noise_offs]
+            if self.precision != 'fixed':
+                d = np.multiply(d, Codec.noise_gain,
+                        out=self.work_buffer('excitation', (160, )))
         #d[0] = subframe1['stochastic_gain'] / 2.**5
         #d[self.N[1]] = subframe2['stochastic_gain'] / 2.**5
         #d[self.N[1] + self.N[2]] = subframe3['stochastic_gain'] / 2.**5
 
-        s = self.short_term_synthesis_filtering(d, refl_coefs3)
+        with profiler.stage('synthesis_filtering'):
+            s = self.short_term_synthesis_filtering(d, refl_coefs3, out=out)
+        return s
+
+    def decode_frames(self, lar_idx, gains=None):
+        """Decode N frames given by (N, 10) array of LAR indexes and (N, 3)
+        array of stochastic gains of subframes, return (N, 160) array of
+        samples. Result and codec state are the same as when decode() is
+        called for each frame, only synthesis filter runs frame by frame."""
+        lar_idx = np.asarray(lar_idx).reshape(-1, 10)
+        n = len(lar_idx)
+        if gains is not None and np.shape(gains) != (n, 3):
+            raise ValueError('gains shape must be (%d, 3)' % n)
+        s = np.empty((n, 160), dtype=self.dtype)
+        if not n:
+            return s
+        profiler = self.profiler
+
+        with profiler.stage('dequantize', n):
+            lars = self.lar_idxs2lars(lar_idx)
+        with profiler.stage('interpolate', n):
+# previous LARs of each frame, the first frame without history is not interpolated
+            old_lars = np.empty_like(lars)
+            old_lars[1:] = lars[:-1]
+            old_lars[0] = lars[0] if self.old_lars is None else self.old_lars
+            w = LARQuantizer.interpolation
+            lars3 = w[:, 0, None]*old_lars[:, None] + w[:, 1, None]*lars[:, None]
+            if self.old_lars is None:
+                lars3[0] = lars[0]
+            if self.precision == 'fixed':
+                w = Codec.quantizer.interpolation8
+                fixed_lars = Codec.lars2fixed(lars).astype(np.int32)[:, None]
+                old_lars = Codec.lars2fixed(old_lars).astype(np.int32)[:, None]
+                lars3 = (w[:, 0, None]*old_lars + w[:, 1, None]*fixed_lars + 4) >> 3
+                refl_coefs3 = Codec.lar2refl_coef_fixed(lars3)
+            elif self.approx:
+                refl_coefs3 = Codec.lar2refl_coef_approx(lars3).astype(self.dtype,
+                        copy=False)
+            else:
+                refl_coefs3 = Codec.lar2refl_coef_eval(lars3).astype(self.dtype,
+                        copy=False)
+            self.old_lars = lars[-1].copy()
+
+        with profiler.stage('noise', n):
+# position of frame in noise table cycles over 1..len/160-1, see decode()
+            noise = self.noise
+            n_pos = len(noise) // 160 - 1
+            pos = (self.noise_offs // 160 - 1 + np.arange(1, n + 1)) % n_pos + 1
+            d = noise[160*pos[:, None] + np.arange(-160, 0)]
+            if self.precision != 'fixed':
+                d *= Codec.noise_gain
+            self.noise_offs = int(pos[-1]) * 160
+
+        with profiler.stage('synthesis_filtering', n):
+            for i in range(n):
+                self.short_term_synthesis_filtering(d[i], refl_coefs3[i], out=s[i])
         return s
 
     def encode(self, samples):
         """Takes 160 samples in 13 bit uniform format (16 bit signed int)
-        and compress it using RP-CELP codec."""
+        and compress it using RP-CELP codec. Returns LAR indexes and
+        dictionaries with codes of subframe parameters, see search_subframes()."""
 # normalize samples to range <-1, 1>
-        samples = np.array(samples)/(2**12-1)
+        samples = np.true_divide(samples, 2**12-1,
+                out=self.work_buffer('samples', np.shape(samples)))
         lp = self.lp_analysis(samples)
+        with self.profiler.stage('subframe_search'):
+            subframes, _ = self.search_subframes(samples, lp['refl_coefs'])
 
         return {
                 'lar_idx': lp['lar_idx'],
+                'subframe1': subframes[0],
+                'subframe2': subframes[1],
+                'subframe3': subframes[2],
                 }
 
+    def encode_frames(self, samples):
+        """Takes array of N frames (N, 160) in 13 bit uniform format and
+        returns (N, 10) array of LAR indexes. LAR indexes and LP analysis
+        state are the same as when encode() is called for each frame,
+        subframe parameters are not searched. Subframe search state (exc,
+        syn_mem) does not follow the signal, it is reset as of new Codec, so
+        encode() of following frames does not depend on frames encoded
+        before."""
+        samples = np.true_divide(np.asarray(samples).reshape(-1, 160), 2**12-1,
+                dtype=self.dtype)
+        lp = self.lp_analysis_frames(samples)
+        if len(samples):
+            self.exc = np.zeros(Codec.ltp_lag_max)
+            self.syn_mem = np.zeros(10)
+
+        return lp['lar_idx']
+
+    def encode_stream(self, frames, batch_size=1024):
+        """Encode iterable of 160 samples frames, yields (n, 10) arrays of
+        LAR indexes for each batch of up to batch_size frames."""
+        batch = []
+        for frame in frames:
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield self.encode_frames(batch)
+                batch = []
+        if batch:
+            yield self.encode_frames(batch)
+
     def lp_analysis(self, samples):
-        autocorr = self.autocorrelate(samples)
-        autocorr = autocorr * Codec.band_expansion
-        refl_coefs = self.autocorr2refl_coeffs(autocorr)
-        lars = self.refl_coefs2lars(refl_coefs)
-        lar_idx = self.lars2lar_idxs(lars)
-        lar_quant = self.lar_idxs2lars(lar_idx)
-        lars3 = self.lar_interpolate(lar_quant)
-        refl_coefs = [self.lar2refl_coef(lars) for lars in lars3]
-        s = self.win_shift(samples)
-        d = self.short_term_analysis_filtering(s, refl_coefs)
+        profiler = self.profiler
+        with profiler.stage('autocorrelate'):
+            autocorr = self.autocorrelate(samples)
+            autocorr = autocorr * Codec.band_expansion
+        with profiler.stage('refl_coefs'):
+            refl_coefs = self.autocorr2refl_coeffs(autocorr)
+        with profiler.stage('quantize'):
+            lars = self.refl_coefs2lars(refl_coefs)
+            lar_idx = self.lars2lar_idxs(lars)
+        refl_coefs = self.lar_idxs2refl_coefs(lar_idx)
+        with profiler.stage('analysis_filtering'):
+            s = self.win_shift(samples)
+            d = self.short_term_analysis_filtering(s, refl_coefs)
 
         return {
                 'lar_idx': lar_idx,
+                'refl_coefs': refl_coefs,
                 }
 
+    def lp_analysis_frames(self, samples):
+        """LP analysis of (N, 160) array of normalized samples.
+        Frame independent stages runs for all frames at once, only the state
+        carried between frames (old_lars, prec, s_prev) is updated."""
+        profiler = self.profiler
+        with profiler.stage('autocorrelate', len(samples)):
+            autocorr = self.autocorrelate(samples)
+            autocorr = autocorr * Codec.band_expansion
+        with profiler.stage('refl_coefs', len(samples)):
+            refl_coefs = self.autocorr2refl_coeffs(autocorr)
+        with profiler.stage('quantize', len(samples)):
+            lars = self.refl_coefs2lars(refl_coefs)
+            lar_idx = self.lars2lar_idxs(lars)
+
+        if len(samples):
+            self.old_lars = self.lar_idxs2lars(lar_idx[-1])
+# s_prev is the oldest sample of last frame window, see win_shift()
+            if len(samples) > 1:
+                self.s_prev = samples[-2][79]
+            else:
+                self.s_prev = self.prec[0]
+            self.prec[:] = samples[-1][79:]
+
+        return {
+                'lar_idx': lar_idx,
+                }
+
+    def search_subframes(self, samples, refl_coefs3):
+        """Analysis by synthesis search of LTP (adaptive codebook) and
+        stochastic regular pulse codebook parameters of 3 subframes (N) of
+        160 normalized samples, refl_coefs3 are quantized reflection
+        coefficients of subframes. Returns list of dictionaries with codes
+        of parameters and samples synthesized from selected excitation.
+
+        For each subframe the impulse response matrix H of synthesis filter
+        and its correlation matrix H^T H are computed once, all lags and
+        all codebook vectors are then scored by matrix products. Candidates
+        are pruned in two levels, coarse score selects a few of them for
+        exact error evaluation over all quantized gains. Search runs in
+        float64 for all precisions. LTP gain table and stochastic codebooks
+        are placeholders, TETRAPOL tables are unknown."""
+        import scipy.linalg
+        import scipy.signal
+        if self.precision == 'fixed':
+            refl_coefs3 = refl_coefs3 / 2.**15
+        subframes = []
+        y = np.empty(len(samples))
+        start = 0
+        for sf, (n, refl_c) in enumerate(zip(self.N, refl_coefs3)):
+            x = samples[start:start + n]
+            a = self.refl_coefs2lattice_matrix(refl_c)[10, ::-1]
+            h = scipy.signal.lfilter([1.], a, np.eye(1, n)[0])
+# lower triangular Toeplitz matrix, column j is h delayed by j samples
+            H = self.work_buffer('search_H%d' % sf, (n, n), np.float64)
+            H[...] = 0
+            for j in range(n):
+                H[j:, j] = h[:n - j]
+            phi = np.matmul(H.T, H,
+                    out=self.work_buffer('search_phi%d' % sf, (n, n), np.float64))
+            zi = -scipy.linalg.hankel(a[1:]) @ self.syn_mem
+            zir, _ = scipy.signal.lfilter([1.], a, np.zeros(n), zi=zi)
+            target = x - zir
+
+# adaptive codebook, lags shorter than subframe repeat the last period
+            offsets = self.ltp_lag_offsets(n)
+            V = np.take(self.exc, offsets, mode='wrap',
+                    out=self.work_buffer('search_ltp%d' % sf, offsets.shape,
+                        np.float64))
+            corr = V @ (H.T @ target)
+            VPhi = np.matmul(V, phi,
+                    out=self.work_buffer('search_ltp_phi%d' % sf, V.shape,
+                        np.float64))
+            energy = np.einsum('ij,ij->i', VPhi, V)
+            lag_code, gain_code, gain = self.search_gains(corr, energy,
+                    Codec.ltp_gains, np.arange(len(V)), Codec.ltp_candidates)
+            v = V[lag_code]
+            target = target - gain * (H @ v)
+
+# stochastic codebook, the coarse energy ignores cross terms of pulses,
+# so it does not depend on signs, only on spacing and phase
+            C = self.stochastic_codebook(n, Codec.st_sig_ph_bits[sf])
+            codes = np.arange(C.shape[1])
+            diag = np.diag(phi)
+            energy = np.concatenate([
+                np.bincount(np.arange(n) % spacing, diag)[codes % spacing]
+                for spacing in Codec.rp_spacing])
+            C = C.reshape(-1, n)
+            corr = C @ (H.T @ target)
+            candidates = self.best_candidates(corr, energy, Codec.st_candidates)
+            Cc = C[candidates]
+            energy = np.einsum('ij,ij->i', Cc @ phi, Cc)
+            i, st_gain_code, st_gain = self.search_gains(corr[candidates], energy,
+                    Codec.QLBG_norm, candidates, len(candidates))
+            st_dec, st_sig_ph = divmod(int(i), 1 << Codec.st_sig_ph_bits[sf])
+
+            u = gain * v + st_gain * C[i]
+            y[start:start + n], _ = scipy.signal.lfilter([1.], a, u, zi=zi)
+            self.exc = np.concatenate((self.exc[n:], u))
+            self.syn_mem = np.concatenate((y[start:start + n][::-1],
+                self.syn_mem))[:10]
+            subframes.append({
+                'LTP_lag': int(lag_code),
+                'LTP_gain': int(gain_code),
+                'stochastic_gain': int(st_gain_code),
+                'st_dec': st_dec,
+                'st_sig_ph': st_sig_ph,
+                })
+            start += n
+        return subframes, y
+
+    @staticmethod
+    def best_candidates(corr, energy, n):
+        """Return indexes of n candidates with the highest normalized
+        correlation, only positive correlation can be matched by gain."""
+        score = np.zeros(len(corr))
+        np.divide(np.square(corr), energy, out=score,
+                where=(corr > 0) & (energy > 0))
+        n = min(n, len(score))
+        return np.argpartition(score, len(score) - n)[len(score) - n:]
+
+    @staticmethod
+    def search_gains(corr, energy, gains, indexes, n):
+        """Select candidate and quantized gain minimizing error
+        |t - g*y|^2 - |t|^2 = g^2*energy - 2*g*corr. Coarse selection of n
+        best candidates precedes evaluation of all gains. Returns index of
+        candidate (from indexes), gain code and gain value."""
+        candidates = Codec.best_candidates(corr, energy, n)
+        err = gains**2 * energy[candidates, None] - 2 * gains * corr[candidates, None]
+        c, g = np.unravel_index(np.argmin(err), err.shape)
+        return indexes[candidates[c]], g, gains[g]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def ltp_lag_offsets(length):
+        """Return (n_lags, length) indexes into excitation history of LTP
+        vectors for all lags, negative indexes count from the end."""
+        lags = np.arange(Codec.ltp_lag_min, Codec.ltp_lag_max + 1)
+        n = np.arange(length)
+        offsets = -lags[:, None] + n % lags[:, None]
+        offsets.flags.writeable = False
+        return offsets
+
+    @staticmethod
+    def stochastic_codebook(length, bits):
+        """Return read-only (len(rp_spacing), 2**bits, length) array of regular
+        pulse vectors. Code c of spacing D has pulses at positions
+        c % D + k*D with signs given by row c // D of fixed sign table."""
+        codebook = Codec.codebooks.get((length, bits))
+        if codebook is not None:
+            return codebook
+        codebook = np.zeros((len(Codec.rp_spacing), 1 << bits, length))
+        rng = np.random.default_rng(length * 1000 + bits)
+        codes = np.arange(1 << bits)
+        for i, spacing in enumerate(Codec.rp_spacing):
+            n_pulses = -(-length // spacing)
+            signs = rng.choice((-1., 1.), size=((1 << bits) // spacing + 1, n_pulses))
+            pos = codes[:, None] % spacing + spacing * np.arange(n_pulses)
+            valid = pos < length
+            rows = np.broadcast_to(codes[:, None], pos.shape)
+            codebook[i, rows[valid], pos[valid]] = signs[codes // spacing][valid]
+        codebook.flags.writeable = False
+        Codec.codebooks[(length, bits)] = codebook
+        return codebook
+
     def autocorrelate(self, samples):
+        """Autocorrelation for lags 0..10 over last axis of samples.
+        Single frame is correlated in one pass, frames in (N, 160) array are
+        processed together by matmul, both computes the same dot products."""
         # TODO: should we autocorrelate using samples from previous frame?
-        return [ np.correlate(samples, samples[i:])[0] for i in range(11) ]
+        samples = np.asarray(samples)
+        if samples.dtype != np.float32:
+            samples = samples.astype(float, copy=False)
+        n = samples.shape[-1]
+        if samples.ndim == 1:
+            return np.correlate(samples, samples, 'full')[n-1:n+10]
+        samples = samples[..., None, :]
+        return np.stack([(samples[..., i:] @ samples[..., 0, :n-i, None])[..., 0, 0]
+            for i in range(11)], axis=-1)
 
     def autocorr2refl_coeffs(self, autocorr):
         """Literature: Speech Coding Algorithms, Wai C. Chu page 119 (we fixed? the sign
-        in 4.80. IT++ lerouxguegenrc() (but this function accessed array out of range)."""
-# prevent divission by zero bellow
-        if abs(autocorr[0]) < 2**-12:
-            autocorr[0] = 2**-12
-
+        in 4.80. IT++ lerouxguegenrc() (but this function accessed array out of range).
+        Works over last axis of autocorr, so many frames can be processed at once."""
+# lags are stored in first axis, so each step works on contiguous rows
+        autocorr = np.asarray(autocorr, dtype=float)
+        frames = autocorr.ndim > 1
+        if frames:
+            autocorr = np.moveaxis(autocorr, -1, 0)
         M = len(autocorr) - 1
-        r = np.empty(2*M+1)
-        rny = np.empty(2*M+1)
-        refl_coefs = np.empty(M)
+        r = np.empty((2*M+1, ) + autocorr.shape[1:])
+        refl_coefs = np.empty((M, ) + autocorr.shape[1:])
 
-        for j in range(0, M+1):
-            r[M-j] = autocorr[j]
-            r[M+j] = autocorr[j]
+        r[M::-1] = autocorr
+        r[M:] = autocorr
+# prevent divission by zero bellow
+        r[M] = np.where(abs(r[M]) < 2**-12, 2**-12, r[M])
 
         for m in range(1, M+1):
             refl_coefs[m-1] = -r[M+m] / r[M]
             if m == M:
                 break
-            for j in range(-M+m+1, M+1):
-                rny[M+j] = r[M+j] + refl_coefs[m-1] * r[M+m-j]
-            for j in range(-M, M+1):
-                r[M+j] = rny[M+j]
+# only r[m:] is used by following iterations
+            rny = r[m+1:] + refl_coefs[m-1] * r[2*M-1:m-1:-1]
+            r[m+1:] = rny
 
+        if frames:
+            return np.ascontiguousarray(np.moveaxis(refl_coefs, 0, -1))
         return refl_coefs
 
     def refl_coefs2lars(self, refl_coefs):
         """If approx is True use approximation as specified in standard,
         if set to False use regular equation."""
+        if self.precision == 'fixed':
+            lars = self.refl_coefs2lars_fixed(self.float2fixed(refl_coefs))
+            return lars / 2.**14
         if self.approx:
             return self.refl_coefs2lars_approx(refl_coefs)
         else:
             return self.refl_coefs2lars_eval(refl_coefs)
 
     def refl_coefs2lars_approx(self, refl_coefs):
-        lars = []
-        for i in range(len(refl_coefs)):
-            refl_c = refl_coefs[i]
-            abs_arefl_c = abs(refl_c)
-            if abs_arefl_c < 0.675:
-                lar = refl_c
-            elif abs_arefl_c < 0.950:
-                lar = np.copysign(2*abs_arefl_c - 0.675, refl_c)
-            else:
-                lar = np.copysign(8*abs_arefl_c - 6.375, refl_c)
-            lars.append(lar)
-
-        return lars
+        refl_coefs = np.asarray(refl_coefs)
+        abs_refl_c = abs(refl_coefs)
+        return np.where(abs_refl_c < 0.675, refl_coefs,
+                np.where(abs_refl_c < 0.950,
+                    np.copysign(2*abs_refl_c - 0.675, refl_coefs),
+                    np.copysign(8*abs_refl_c - 6.375, refl_coefs)))
+
+    @staticmethod
+    def refl_coefs2lars_fixed(refl_coefs):
+        """Fixed point refl_coefs2lars_approx() of GSM 06.10 (4.2.6), Q15
+        reflection coefficients are converted to Q15 of LAR/2."""
+        refl_coefs = np.asarray(refl_coefs, dtype=np.int32)
+        abs_refl_c = abs(refl_coefs)
+        lars = np.where(abs_refl_c < 22118, abs_refl_c >> 1,
+                np.where(abs_refl_c < 31130, abs_refl_c - 11059,
+                    (abs_refl_c - 26112) << 2))
+        return (np.sign(refl_coefs) * lars).astype(np.int16)
 
     def refl_coefs2lars_eval(self, refl_coefs):
+        refl_coefs = np.asarray(refl_coefs)
         return np.log10((1 + refl_coefs)/(1 - refl_coefs))
 
     def lars2lar_idxs(self, lars):
-        """Return LARs indexes of LARs"""
-        lar_idx = []
-        for i in range(len(self.LAR_idx)):
-            lar = lars[i]
-            LAR_idx = self.LAR_idx[i]
-            if lar >= LAR_idx[-1]:
-                lar_idx.append(len(LAR_idx) - 1)
-                continue
-            if lar <= LAR_idx[0]:
-                lar_idx.append(0)
-                continue
-            idx = bisect_left(LAR_idx, lar)
-            if (LAR_idx[idx-1] - lar) / (LAR_idx[idx] - LAR_idx[idx-1]) >= 0.5:
-                lar_idx.append(idx+1)
-                continue
-            lar_idx.append(idx)
-
-        return lar_idx
-
-    def lar_idxs2lars(self, lar_idx):
+        """Return LARs indexes of LARs, works over last axis of lars."""
+        return self.quantizer.quantize(lars)
+
+    def lar_idxs2lars(self, lar_idx, out=None):
         """Return quantized values for LAR indexes."""
-        return np.array([self.LAR_idx[i][lar_idx[i]] for i in range(len(lar_idx))])
+        return self.quantizer.dequantize(lar_idx, out=out)
+
+    def lar_idxs2refl_coefs(self, lar_idx):
+        """Return reflection coefficients of 3 subframes for LAR indexes,
+        same as lar_interpolate() and lar2refl_coef() of dequantized LARs."""
+        with self.profiler.stage('dequantize'):
+            lars = self.lar_idxs2lars(np.asarray(lar_idx),
+                    out=self.work_buffer('lars', (10, ), np.float64))
+        with self.profiler.stage('interpolate'):
+            out = None
+            if self.buffers is not None:
+                out = (self.work_buffer('refl_coefs3', (3, 10), np.float64),
+                        self.work_buffer('lars3', (3, 10), np.float64))
+            refl_coefs3 = self.quantizer.interpolate_refl_coefs(self.old_lars, lars,
+                    self.approx, self.precision, out)
+        if self.buffers is not None:
+# buffer of previous LARs is filled by the next frame
+            self.buffers['lars'] = self.old_lars
+        self.old_lars = lars
+        return refl_coefs3
 
     def lar_interpolate(self, lars):
         """Create 3 set of LARs interpolating the current and previous set.
@@ -192,40 +691,80 @@ class Codec:
         else:
             return self.lar2refl_coef_eval(lars)
 
-    def lar2refl_coef_approx(self, lars):
-        refl_coefs = []
-        for lar in lars:
-            abs_lar = abs(lar)
-            if abs_lar < 0.675:
-                refl_coef = lar
-            elif abs_lar < 1.225:
-                refl_coef = np.copysign(0.5*abs_lar + 0.3375, lar)
-            else:
-                refl_coef = np.copysign(0.125*abs_lar + 0.796875, lar)
-
-            refl_coefs.append(refl_coef)
-        return refl_coefs
-
-    def lar2refl_coef_eval(self, lars):
+    @staticmethod
+    def lar2refl_coef_approx(lars, out=None):
+        """Piecewise linear LAR to reflection coefficient conversion, result
+        is written into out (not overlapping lars) if given."""
+        lars = np.asarray(lars)
+        abs_lar = abs(lars)
+# segments slopes decrease, so the curve is minimum of the 3 lines
+        refl_coefs = np.multiply(abs_lar, 0.125, out=out)
+        refl_coefs += 0.796875
+        np.minimum(refl_coefs, abs_lar, out=refl_coefs)
+        abs_lar *= 0.5
+        abs_lar += 0.3375
+        np.minimum(refl_coefs, abs_lar, out=refl_coefs)
+        return np.copysign(refl_coefs, lars, out=refl_coefs)
+
+    @staticmethod
+    def lar2refl_coef_fixed(lars):
+        """Fixed point lar2refl_coef_approx() of GSM 06.10 (4.2.8), Q15 of
+        LAR/2 is converted to Q15 reflection coefficients, the last segment
+        saturates."""
+        lars = np.asarray(lars, dtype=np.int32)
+        abs_lar = abs(lars)
+        refl_coefs = np.where(abs_lar < 11059, abs_lar << 1,
+                np.where(abs_lar < 20070, abs_lar + 11059,
+                    np.minimum((abs_lar >> 2) + 26112, 32767)))
+        return (np.sign(lars) * refl_coefs).astype(np.int16)
+
+    @staticmethod
+    def lars2fixed(lars):
+        """Return Q15 int16 of LAR/2, the format of fixed point LARs."""
+        return Codec.float2fixed(np.asarray(lars) / 2)
+
+    @staticmethod
+    def float2fixed(x):
+        """Return Q15 int16 of x, values out of range saturate."""
+        return np.clip(np.rint(np.asarray(x) * 2.**15), -32768, 32767).astype(np.int16)
+
+    @staticmethod
+    def lar2refl_coef_eval(lars, out=None):
+        """Exact LAR to reflection coefficient conversion, result is written
+        into out (not overlapping lars) if given."""
         lars = np.power(10, lars)
-        return (lars - 1)/(lars + 1)
+        refl_coefs = np.subtract(lars, 1, out=out)
+        lars += 1
+        return np.divide(refl_coefs, lars, out=refl_coefs)
 
     def win_shift(self, samples):
         """5.8 Temporal windows shift.
         Returns current window samples with one extra sample from past at the begin."""
-        s = np.empty(161)
+        s = self.work_buffer('win_shift', (161, ))
         s[:81] = self.prec
         s[81:] = samples[:80]
         self.prec[:] = samples[79:]
         return s
 
     def short_term_analysis_filtering(self, s, refl_coefs):
-        """5.9 Short term analysis filtering."""
-        d = np.empty(len(s))
+        """5.9 Short term analysis filtering.
+        Filter is selected by filter_backend, 'python' is the reference
+        lattice implementation, 'lfilter' uses direct form filter."""
+        if self.precision == 'fixed':
+            return self.short_term_analysis_filtering_fixed(s, refl_coefs)
+        if self.filter_backend == 'lfilter':
+            return self.short_term_analysis_filtering_lfilter(s, refl_coefs)
+        return self.short_term_analysis_filtering_python(s, refl_coefs)
+
+    def short_term_analysis_filtering_python(self, s, refl_coefs):
+        d = self.work_buffer('analysis', (len(s), ))
         r = refl_coefs[0]
 # k-1 element of tmp1/tmp2 is not defined, we use value from previous frame if possible
-        tmp1 = np.empty((11, len(s) + 1))
-        tmp2 = np.empty((11, len(s) + 1))
+# for tmp[0], higher orders starts from zero
+        tmp1 = self.work_buffer('analysis_tmp1', (11, len(s) + 1))
+        tmp2 = self.work_buffer('analysis_tmp2', (11, len(s) + 1))
+        tmp1.fill(0.)
+        tmp2.fill(0.)
         tmp1[0][:-1] = s
         tmp2[0][:-1] = s
         tmp1[0][-1] = self.s_prev
@@ -243,11 +782,63 @@ class Codec:
 
         return d
 
-    def short_term_synthesis_filtering(self, d, refl_coefs):
-        """6.3 Short term synthesis filter. Original is broken using GSM version."""
+    def short_term_analysis_filtering_fixed(self, s, refl_coefs):
+        """Lattice of short_term_analysis_filtering_python() in 16 bit fixed
+        point arithmetic of GSM 06.10 (4.2.10), multiplications are rounded
+        and additions saturate. s are normalized samples, refl_coefs are Q15
+        integers, returns Q15 residual."""
+        d = self.work_buffer('analysis', (len(s), ), np.int16)
+        x = self.float2fixed(s).tolist()
+# backward prediction errors of previous sample, higher orders start from zero
+        u = [int(self.float2fixed(self.s_prev)), ] + [0, ] * 9
+        self.s_prev = s[0]
+        for sl, refl_c in zip(self.subframe_slices(len(s)), refl_coefs):
+            r = refl_c.tolist()
+            for k in range(sl.start, sl.stop):
+                di = sav = x[k]
+                for i in range(10):
+                    ui = u[i]
+                    u[i] = sav
+                    sav = min(max(ui + ((r[i]*di + 16384) >> 15), -32768), 32767)
+                    di = min(max(di + ((r[i]*ui + 16384) >> 15), -32768), 32767)
+                d[k] = di
+
+        return d
+
+    def short_term_analysis_filtering_lfilter(self, s, refl_coefs):
+        """Same as short_term_analysis_filtering_python() but every subframe
+        is filtered by scipy.signal.lfilter. Backward prediction errors at
+        the end of subframe are converted into lfilter state of the next
+        subframe, so result matches the lattice filter."""
+        import scipy.signal
+        d = self.work_buffer('analysis', (len(s), ))
+        b = np.zeros(10)
+        b[0] = self.s_prev
+        self.s_prev = s[0]
+        for sl, a, L, Z in zip(self.subframe_slices(len(s)), *self.direct_forms(refl_coefs)):
+            d[sl], _ = scipy.signal.lfilter(a, [1.], s[sl], zi=Z @ b)
+# subframes are longer than filter order, so backward errors depend only on s
+            x_prev = s[sl][:-11:-1]
+            if len(x_prev) < 10:
+                x_prev = np.concatenate((x_prev, np.linalg.solve(L[:10, :10], b)))
+            b = L[:10, :10] @ x_prev[:10]
+
+        return d
+
+    def short_term_synthesis_filtering(self, d, refl_coefs, out=None):
+        """6.3 Short term synthesis filter. Original is broken using GSM version.
+        Filter is selected by filter_backend, see short_term_analysis_filtering().
+        Output is written into out if given."""
+        if self.precision == 'fixed':
+            return self.short_term_synthesis_filtering_fixed(d, refl_coefs, out)
+        if self.filter_backend == 'lfilter':
+            return self.short_term_synthesis_filtering_lfilter(d, refl_coefs, out)
+        return self.short_term_synthesis_filtering_python(d, refl_coefs, out)
+
+    def short_term_synthesis_filtering_python(self, d, refl_coefs, out=None):
         r = refl_coefs[0]
         v = self.v
-        s = np.empty(len(d))
+        s = self.work_buffer('synthesis', (len(d), )) if out is None else out
 
         for k in range(len(d)):
             sri = d[k]
@@ -264,3 +855,86 @@ class Codec:
         self.v = v
 
         return s
+
+    def short_term_synthesis_filtering_fixed(self, d, refl_coefs, out=None):
+        """Lattice of short_term_synthesis_filtering_python() in 16 bit fixed
+        point arithmetic of GSM 06.10 (4.2.11). d is Q15 excitation scaled by
+        2**fixed_shift, refl_coefs are Q15 integers, returned samples are
+        scaled back to float."""
+        s = self.work_buffer('synthesis', (len(d), )) if out is None else out
+        x = self.work_buffer('synthesis_fixed', (len(d), ), np.int16)
+        v = self.v.tolist()
+        d = d.tolist()
+        for sl, refl_c in zip(self.subframe_slices(len(d)), refl_coefs):
+            r = refl_c.tolist()
+            for k in range(sl.start, sl.stop):
+                sri = d[k]
+                for i in range(9, -1, -1):
+                    sri = min(max(sri - ((r[i]*v[i] + 16384) >> 15), -32768), 32767)
+                    v[i+1] = min(max(v[i] + ((r[i]*sri + 16384) >> 15), -32768), 32767)
+                x[k] = v[0] = sri
+
+        self.v[:] = v
+        return np.multiply(x, 2.**-(15 + Codec.fixed_shift), out=s)
+
+    def short_term_synthesis_filtering_lfilter(self, d, refl_coefs, out=None):
+        """Same as short_term_synthesis_filtering_python() but every subframe
+        is filtered by scipy.signal.lfilter, lattice state self.v is
+        converted into lfilter state and back."""
+        import scipy.signal
+        s = self.work_buffer('synthesis', (len(d), )) if out is None else out
+        v = self.v
+        for sl, a, L, Z in zip(self.subframe_slices(len(d)), *self.direct_forms(refl_coefs)):
+            s[sl], _ = scipy.signal.lfilter([1.], a, d[sl], zi=-(Z @ v[:10]))
+# subframes are longer than filter order, so last state is defined by s
+            s_prev = s[sl][:-12:-1]
+            if len(s_prev) > 10:
+                v = L @ s_prev
+            else:
+                s_prev = np.concatenate((s_prev, np.linalg.solve(L[:10, :10], v[:10])))
+                v = np.append(L[:10, :10] @ s_prev[:10], v[10])
+
+        self.v = v
+
+        return s
+
+    def subframe_slices(self, length):
+        """Return slices of samples filtered with each of 3 set of reflection
+        coefficients, the last sample of each subframe uses previous set."""
+        n1 = self.N[0] + 1
+        n2 = self.N[0] + self.N[1] + 1
+        return (slice(0, n1), slice(n1, n2), slice(n2, length))
+
+    @staticmethod
+    def refl_coefs2lattice_matrix(refl_coefs):
+        """Convert reflection coefficients to direct form filters of all orders
+        (step-up recursion). Row i of returned (11, 11) matrix gives backward
+        prediction error of order i from current and past samples
+        b_i[n] = sum(L[i, j] * x[n-j]), so L[10, ::-1] is the direct form
+        polynomial A(z) = 1 + a_1*z^-1 + ... + a_10*z^-10. Works over last
+        axis of refl_coefs."""
+        refl_coefs = np.asarray(refl_coefs, dtype=np.float64)
+        M = refl_coefs.shape[-1]
+        L = np.zeros(refl_coefs.shape[:-1] + (M + 1, M + 1))
+        L[..., 0, 0] = 1.
+        for i in range(1, M + 1):
+            L[..., i, 1:i+1] = L[..., i-1, :i]
+            L[..., i, :i] += refl_coefs[..., i-1, None] * L[..., i-1, i-1::-1]
+        return L
+
+# indexes of Hankel matrix of a[1:] in a[1:] padded by zeros
+    hankel_idx = np.add.outer(np.arange(10), np.arange(10))
+
+    @staticmethod
+    def direct_forms(refl_coefs3):
+        """Return direct form polynomials a (3, 11), lattice matrices L
+        (3, 11, 11), see refl_coefs2lattice_matrix(), and matrices Z
+        (3, 10, 10) converting backward prediction errors of orders 0..9 into
+        lfilter state of analysis filter a (-Z for synthesis filter 1/a) of
+        subframes. All subframes are converted at once."""
+        L = Codec.refl_coefs2lattice_matrix(refl_coefs3)
+        a = L[:, 10, ::-1]
+        a_padded = np.concatenate((a[:, 1:], np.zeros((len(a), 10))), axis=1)
+        H = a_padded[:, Codec.hankel_idx]
+        Z = H @ np.linalg.inv(L[:, :10, :10])
+        return a, L, Z
@@ -0,0 +1,301 @@
+"""Multi-process decoding pipeline connected by shared memory rings.
+
+Parser process reads frame logs and containers and writes raw frames into
+input ring of decode worker the stream is pinned to, so codec state of
+stream stays in one process. Worker decodes frames directly from the ring
+and writes 16 bit PCM into its output ring, writer (calling process) takes
+PCM from output rings and writes output files. Nothing is pickled between
+stages, full ring blocks its producer (backpressure)."""
+
+from multiprocessing import shared_memory
+from rp_celp import Codec
+from voice_frame import VoiceFrame
+import decoder
+import frame_container
+import frame_log
+import multiprocessing
+import numpy as np
+import pcm_writer
+import time
+
+
+# kind of ring slot
+FRAMES = 0
+END = 1
+ERROR = 2
+STOP = 3
+
+
+def frames_slot_dtype(batch_frames):
+    return np.dtype([('stream', '<u4'), ('kind', 'u1'), ('n', '<u4'),
+        ('data', 'u1', (batch_frames, VoiceFrame.frame_len))])
+
+
+def pcm_slot_dtype(batch_frames):
+    return np.dtype([('stream', '<u4'), ('kind', 'u1'), ('n', '<u4'),
+        ('pcm', '<i2', (batch_frames, 160))])
+
+
+class SharedRing:
+    """Single producer, single consumer ring of n_slots records of
+    slot_dtype in shared memory. Semaphores count free and filled slots,
+    each side keeps its own position. Slots are accessed as numpy views."""
+    def __init__(self, slot_dtype, n_slots):
+        self.slot_dtype = np.dtype(slot_dtype)
+        self.n_slots = n_slots
+        self.shm = shared_memory.SharedMemory(create=True,
+                size=self.slot_dtype.itemsize * n_slots)
+        self.free = multiprocessing.Semaphore(n_slots)
+        self.filled = multiprocessing.Semaphore(0)
+        self.attach()
+
+    def attach(self):
+        self.slots = np.ndarray((self.n_slots, ), dtype=self.slot_dtype,
+                buffer=self.shm.buf)
+        self.put_pos = 0
+        self.get_pos = 0
+
+    def __getstate__(self):
+# spawned processes attach the segment by name
+        return (self.slot_dtype, self.n_slots, self.shm.name, self.free,
+                self.filled)
+
+    def __setstate__(self, state):
+        self.slot_dtype, self.n_slots, name, self.free, self.filled = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.attach()
+
+    def reserve(self):
+        """Wait for free slot and return it, the slot is passed to consumer
+        by commit()."""
+        self.free.acquire()
+        return self.slots[self.put_pos]
+
+    def commit(self):
+        self.put_pos = (self.put_pos + 1) % self.n_slots
+        self.filled.release()
+
+    def put(self, stream, kind, n=0):
+        """Put slot without payload."""
+        slot = self.reserve()
+        slot['stream'] = stream
+        slot['kind'] = kind
+        slot['n'] = n
+        self.commit()
+
+    def get(self, timeout=None):
+        """Return the oldest filled slot or None on timeout, the slot is
+        valid until release()."""
+        if not self.filled.acquire(timeout=timeout):
+            return None
+        return self.slots[self.get_pos]
+
+    def release(self):
+        self.get_pos = (self.get_pos + 1) % self.n_slots
+        self.free.release()
+
+    def close(self):
+        self.slots = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def error_message(e):
+    return '%s: %s' % (type(e).__name__, e)
+
+
+def put_error(ring, stream, e):
+    """Pass error message of stream through payload (data or pcm) of slot."""
+    payload = ring.slot_dtype.names[-1]
+    msg = error_message(e).encode()[:ring.slot_dtype[payload].itemsize]
+    slot = ring.reserve()
+    slot['stream'] = stream
+    slot['kind'] = ERROR
+    slot['n'] = len(msg)
+    slot[payload].view(np.uint8).ravel()[:len(msg)] = np.frombuffer(msg, dtype=np.uint8)
+    ring.commit()
+
+
+def iter_file_frames(in_file_name, batch_frames):
+    """Yield (n, 15) uint8 arrays of frames of frame log or container."""
+    if frame_container.is_container(in_file_name):
+        container = frame_container.FrameContainer(in_file_name)
+        container.check_single_stream()
+        for i in range(0, len(container), batch_frames):
+            yield container.data(i, i + batch_frames)
+        return
+    with frame_log.open_log(in_file_name) as in_file:
+        for frames in frame_log.iter_voice_frame_batches(in_file, batch_frames):
+            yield frame_log.voice_frames2array(frames)
+
+
+def parse_stage(in_file_names, rings, max_open):
+    """Parser process, streams (files) are read round robin, up to max_open
+    at once, and their frames are put into ring of worker stream % len(rings)."""
+    batch_frames = rings[0].slot_dtype['data'].shape[0]
+    pending = list(enumerate(in_file_names))[::-1]
+    active = []
+    while pending or active:
+        while pending and len(active) < max_open:
+            stream, in_file_name = pending.pop()
+            active.append((stream, iter_file_frames(in_file_name, batch_frames)))
+        for stream, frames_iter in list(active):
+            ring = rings[stream % len(rings)]
+            try:
+                frames = next(frames_iter, None)
+            except Exception as e:
+                put_error(ring, stream, e)
+                active.remove((stream, frames_iter))
+                continue
+            if frames is None:
+                ring.put(stream, END)
+                active.remove((stream, frames_iter))
+                continue
+            slot = ring.reserve()
+            slot['stream'] = stream
+            slot['kind'] = FRAMES
+            slot['n'] = len(frames)
+            slot['data'][:len(frames)] = frames
+            ring.commit()
+    for ring in rings:
+        ring.put(0, STOP)
+        ring.close()
+
+
+def decode_stage(in_ring, out_ring, seed):
+    """Decode worker process, keeps Codec of each of its streams. Stream
+    failing to decode is passed to writer as ERROR, its remaining slots are
+    dropped."""
+    codecs = {}
+    failed = set()
+    while True:
+        slot = in_ring.get()
+        stream, kind, n = int(slot['stream']), int(slot['kind']), int(slot['n'])
+        if stream in failed and kind != STOP:
+            in_ring.release()
+            if kind != FRAMES:
+                failed.discard(stream)
+            continue
+        if kind != FRAMES:
+            out = out_ring.reserve()
+            out['stream'] = stream
+            out['kind'] = kind
+            out['n'] = n
+            if kind == ERROR:
+                out['pcm'].view(np.uint8).ravel()[:n] = slot['data'].ravel()[:n]
+            in_ring.release()
+            out_ring.commit()
+            codecs.pop(stream, None)
+            if kind == STOP:
+                break
+            continue
+        try:
+            records = VoiceFrame.decode_many(slot['data'][:n])
+            codec = codecs.get(stream)
+            if codec is None:
+                codec = codecs[stream] = Codec(approx=False, seed=seed)
+            samples = decoder.decode_records(codec, records)
+        except Exception as e:
+            in_ring.release()
+            codecs.pop(stream, None)
+            failed.add(stream)
+            put_error(out_ring, stream, e)
+            continue
+        in_ring.release()
+        out = out_ring.reserve()
+        out['stream'] = stream
+        out['kind'] = FRAMES
+        out['n'] = n
+        pcm_writer.float2pcm(samples, out=out['pcm'][:n])
+        out_ring.commit()
+    in_ring.close()
+    out_ring.close()
+
+
+def decode_files_pipeline(files, workers=2, batch_frames=256, n_slots=8,
+        seed=None, poll_interval=0.001):
+    """Decode list of (in_file_name, out_file_name) pairs by parser, workers
+    decode and writer processes, see module description. Returns results
+    in the same form as decoder.decode_files(), duration is time from start
+    of pipeline to the end of stream."""
+    in_rings = [SharedRing(frames_slot_dtype(batch_frames), n_slots)
+            for i in range(workers)]
+    out_rings = [SharedRing(pcm_slot_dtype(batch_frames), n_slots)
+            for i in range(workers)]
+    processes = [multiprocessing.Process(target=parse_stage,
+        args=([f[0] for f in files], in_rings, 2 * workers))]
+    processes += [multiprocessing.Process(target=decode_stage,
+        args=(in_ring, out_ring, seed)) for in_ring, out_ring in zip(in_rings, out_rings)]
+    start = time.perf_counter()
+    results = [None, ] * len(files)
+    writers = {}
+# error messages of streams failed in writer
+    errors = {}
+    n_frames = [0, ] * len(files)
+    try:
+        for p in processes:
+            p.start()
+        running = set(range(workers))
+        while running:
+# worker waiting for free slot of ring, which is not read, would block
+# other streams, so no ring is waited for long
+            got = False
+            for i in list(running):
+                slot = out_rings[i].get(timeout=0)
+                if slot is None:
+                    continue
+                got = True
+                stream, kind, n = int(slot['stream']), int(slot['kind']), int(slot['n'])
+                if kind == STOP:
+                    running.discard(i)
+                elif kind == FRAMES:
+# frames of stream which failed to write are dropped until its end
+                    if stream not in errors:
+                        try:
+                            writer = writers.get(stream)
+                            if writer is None:
+                                writer = writers[stream] = pcm_writer.open_pcm(
+                                        files[stream][1], samp_rate=Codec.samp_rate)
+                            writer.write_pcm(slot['pcm'][:n].ravel())
+                            n_frames[stream] += n
+                        except Exception as e:
+                            errors[stream] = error_message(e)
+                else:
+                    error = errors.pop(stream, None)
+                    if kind == ERROR and error is None:
+                        error = slot['pcm'].view(np.uint8).ravel()[:n].tobytes().decode(
+                                errors='replace')
+                    try:
+                        writer = writers.pop(stream, None)
+                        if writer is None and error is None:
+                            writer = pcm_writer.open_pcm(files[stream][1],
+                                    samp_rate=Codec.samp_rate)
+                        if writer is not None:
+                            writer.close()
+                    except Exception as e:
+                        if error is None:
+                            error = error_message(e)
+                    if error is not None:
+                        n_frames[stream] = 0
+                    results[stream] = (files[stream][0], files[stream][1],
+                            n_frames[stream], time.perf_counter() - start, error)
+                out_rings[i].release()
+            if not got:
+                for p in processes:
+                    if p.exitcode not in (None, 0):
+                        raise RuntimeError('Pipeline process %s died' % p.name)
+                time.sleep(poll_interval)
+        for p in processes:
+            p.join()
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for writer in writers.values():
+            writer.close()
+        for ring in in_rings + out_rings:
+            ring.unlink()
+    return results
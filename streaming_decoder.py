@@ -0,0 +1,108 @@
+from collections import deque
+from rp_celp import Codec
+from voice_frame import FrameRing, VoiceFrame
+import frame_log
+import numpy as np
+import pcm_writer
+import time
+
+
+class StreamingDecoder:
+    """Decode VOICE frames as they arrive from socket or pipe.
+
+    Input is raw frame data (15 bytes per frame) or JSON lines frame log
+    (json=True), it can be split into chunks arbitrarily. Decoded frames are
+    kept in jitter buffer of jitter_frames frames and emitted as 16 bit PCM
+    blocks of block_frames frames. Parameters of the last history_frames
+    frames are kept in self.history ring buffer."""
+    def __init__(self, json=False, jitter_frames=0, block_frames=1, codec=None,
+            stats_len=10000, history_frames=0):
+        self.json = json
+        self.jitter_frames = jitter_frames
+        self.block_frames = block_frames
+        self.codec = Codec(approx=False) if codec is None else codec
+        self.buf = b''
+        self.pcm = deque()
+# decode time of recent frames
+        self.frame_times = deque(maxlen=stats_len)
+        self.n_frames = 0
+        self.history = FrameRing(history_frames) if history_frames else None
+
+    def feed(self, data):
+        """Process next chunk of input data, return list of PCM blocks
+        ready for playback."""
+        self.buf += data
+        self.decode_frames(self.get_frames())
+
+        blocks = []
+        while len(self.pcm) >= self.jitter_frames + self.block_frames:
+            blocks.append(self.pop_block(self.block_frames))
+        return blocks
+
+    def flush(self):
+        """Return remaining PCM blocks from jitter buffer, the last one can be
+        shorter. The last JSON line is decoded even without newline,
+        incomplete input is dropped."""
+        if self.json and self.buf:
+            try:
+                self.decode_frames(list(frame_log.iter_voice_frames([self.buf])))
+            except ValueError:
+                pass
+        self.buf = b''
+        blocks = []
+        while self.pcm:
+            blocks.append(self.pop_block(min(self.block_frames, len(self.pcm))))
+        return blocks
+
+    def decode_frames(self, frames):
+        """Decode list of frames data into jitter buffer."""
+        for frame in frames:
+            start = time.perf_counter()
+            record = VoiceFrame(frame).record
+            if self.history is not None:
+                self.history.append(record)
+            self.pcm.append(pcm_writer.float2pcm(self.codec.decode(record)))
+            self.frame_times.append(time.perf_counter() - start)
+            self.n_frames += 1
+
+    def pop_block(self, n_frames):
+        return np.concatenate([self.pcm.popleft() for i in range(n_frames)])
+
+    def get_frames(self):
+        """Remove complete frames from input buffer and return their data."""
+        if self.json:
+            lines = self.buf.split(b'\n')
+            self.buf = lines.pop()
+            return list(frame_log.iter_voice_frames(lines))
+
+        n = len(self.buf) // VoiceFrame.frame_len * VoiceFrame.frame_len
+        frames = [self.buf[i:i + VoiceFrame.frame_len]
+                for i in range(0, n, VoiceFrame.frame_len)]
+        self.buf = self.buf[n:]
+        return frames
+
+    async def decode_stream(self, reader, chunk_size=4096):
+        """Asynchronous generator of PCM blocks decoded from asyncio.StreamReader,
+        use as: async for block in decoder.decode_stream(reader)."""
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                break
+            for block in self.feed(data):
+                yield block
+        for block in self.flush():
+            yield block
+
+    def latency_stats(self):
+        """Return dictionary with number of frames and mean, p50, p99 and max
+        of recent frames decode time in seconds."""
+        times = np.array(self.frame_times)
+        if not len(times):
+            return {'frames': self.n_frames}
+        return {
+                'frames': self.n_frames,
+                'mean': times.mean(),
+                'p50': np.percentile(times, 50),
+                'p99': np.percentile(times, 99),
+                'max': times.max(),
+                }
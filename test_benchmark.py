@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import benchmark
+import io
+import numpy as np
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic(self):
+        for kind in ('sine', 'noise'):
+            frames = benchmark.synthetic_pcm(10, kind)
+            self.assertEqual(frames.shape, (10, 160))
+            self.assertLessEqual(abs(frames).max(), 2**12-1)
+            np.testing.assert_array_equal(frames, benchmark.synthetic_pcm(10, kind))
+        self.assertEqual(benchmark.synthetic_log(50), benchmark.synthetic_log(50))
+
+    def test_suite(self):
+        results = benchmark.run_suite(sizes=(5, ), cases=('decode', 'lp_stat', ))
+        self.assertEqual(list(results), ['decode/5', 'lp_stat/5'])
+        for r in results.values():
+            self.assertGreater(r['frames_per_sec'], 0)
+            self.assertGreater(r['peak_rss_kb'], 0)
+        self.assertEqual(benchmark.compare(results, results), [])
+
+        baseline = {'decode/5': dict(results['decode/5'])}
+        baseline['decode/5']['frames_per_sec'] *= 2
+        baseline['decode/5']['p50'] /= 2
+        self.assertEqual([r[:2] for r in benchmark.compare(results, baseline)],
+                [('decode/5', 'frames_per_sec'), ('decode/5', 'p50')])
+
+# lp_stat times whole file, per frame latency is not applicable
+        self.assertIsNone(results['lp_stat/5']['p50'])
+        baseline = {'lp_stat/5': dict(results['lp_stat/5'], p50=1e-9, p99=1e-9)}
+        self.assertEqual(benchmark.compare(results, baseline), [])
+        out = io.StringIO()
+        benchmark.print_suite(results, out=out)
+        self.assertIn('\nlp_stat/5,%f,,,' % results['lp_stat/5']['frames_per_sec'],
+                out.getvalue())
+
+    def test_startup(self):
+# heavy imports are deferred until needed, import of tool takes about as
+# long as numpy alone, budget is relative to numpy measured on the same load
+        numpy_time = benchmark.import_time('numpy')[1]
+        for module in benchmark.startup_modules:
+            wall, cumulative, packages = benchmark.import_time(module)
+            self.assertNotIn('scipy', packages, module)
+            self.assertLess(cumulative, 3 * numpy_time, module)
+        self.assertNotIn('concurrent', benchmark.import_time('decoder')[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
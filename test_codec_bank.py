@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+from codec_bank import CodecBank
+from rp_celp import Codec
+import numpy as np
+import unittest
+
+
+class TestCodecBank(unittest.TestCase):
+    lar_idxs = np.random.default_rng(0).integers(0, 8, size=(6, 5, 10))
+
+    def test_decode(self):
+        subframe = {'stochastic_gain': 0}
+        for approx in (True, False):
+            bank = CodecBank(3, approx=approx, seed=0)
+            codecs = [Codec(approx=approx, seed=0) for i in range(5)]
+            channels = [bank.join() for i in range(3)]
+            self.assertEqual(channels, [0, 1, 2])
+            for n, lar_idx in enumerate(TestCodecBank.lar_idxs):
+# channel 1 leaves, new call joins into free channel and bank grows
+                if n == 2:
+                    bank.leave(1)
+                    self.assertEqual(bank.join(), 1)
+                    codecs[1] = Codec(approx=approx, seed=0)
+                    self.assertEqual(bank.join(), 3)
+                    self.assertEqual(bank.join(), 4)
+                    self.assertEqual(bank.n_channels, 6)
+                active = np.flatnonzero(bank.active)
+                s = bank.decode(lar_idx[active])
+                for channel in active:
+                    r = codecs[channel].decode(lar_idx[channel], subframe,
+                            subframe, subframe)
+                    np.testing.assert_array_equal(s[list(active).index(channel)], r)
+                    state = bank.get_state(channel)
+                    np.testing.assert_array_equal(state['v'], codecs[channel].v)
+                    self.assertEqual(state['noise_offs'], codecs[channel].noise_offs)
+
+# decode subset of channels
+            s = bank.decode(TestCodecBank.lar_idxs[0, [4, 0]], channels=[4, 0])
+            for i, channel in enumerate((4, 0)):
+                r = codecs[channel].decode(TestCodecBank.lar_idxs[0, channel],
+                        subframe, subframe, subframe)
+                np.testing.assert_array_equal(s[i], r)
+
+            codec = Codec(approx=approx, seed=0)
+            codec.set_state(bank.get_state(2))
+            bank.set_state(0, codec.get_state())
+            s = bank.decode(TestCodecBank.lar_idxs[1, [2, 2]], channels=[0, 2])
+            np.testing.assert_array_equal(s[0], s[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import decoder
+import json
+import numpy as np
+import os
+import pickle
+import tempfile
+import unittest
+import wave
+
+
+class TestDecoder(unittest.TestCase):
+    @staticmethod
+    def _log(file_name, n_frames):
+        with open(file_name, 'wt') as f:
+            for i in range(n_frames):
+                frame = {'type': 'VOICE', 'data': {'encoding': 'hex',
+                    'value': bytes(range(i, i + 15)).hex()}}
+                print(json.dumps({'event': 'frame', 'frame': frame}), file=f)
+
+    def test_decode_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i, n_frames in enumerate((3, 5)):
+                in_file_name = os.path.join(tmp_dir, 'call%d.json' % i)
+                TestDecoder._log(in_file_name, n_frames)
+                files.append((in_file_name, os.path.join(tmp_dir, 'call%d.wav' % i)))
+            files.append((os.path.join(tmp_dir, 'missing.json'),
+                os.path.join(tmp_dir, 'missing.wav')))
+
+            results = decoder.decode_files(files, jobs=2)
+            self.assertEqual([r[2] for r in results], [3, 5, 0])
+            self.assertEqual([r[4] is None for r in results], [True, True, False])
+            with wave.open(files[1][1], 'rb') as f:
+                self.assertEqual(f.getnframes(), 5 * 160)
+
+            self.assertEqual(decoder.dir_files(tmp_dir, tmp_dir), files[:2])
+
+    def test_decode_file_sharded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_file_name = os.path.join(tmp_dir, 'call.json')
+            TestDecoder._log(in_file_name, 50)
+
+            def decode(name, **kwargs):
+                out_file_name = os.path.join(tmp_dir, name)
+                n_frames = decoder.decode_file_sharded(in_file_name, out_file_name,
+                        **kwargs)
+                self.assertEqual(n_frames, 50)
+                return np.fromfile(out_file_name, dtype=np.int16)
+
+            serial = decode('serial.raw', shard_frames=50, overlap=None)
+            exact = decode('exact.raw', shard_frames=7, overlap=None)
+            np.testing.assert_array_equal(exact, serial)
+            sharded = decode('sharded.raw', jobs=2, shard_frames=7, overlap=10)
+            np.testing.assert_array_equal(sharded[:7*160], serial[:7*160])
+            np.testing.assert_allclose(sharded, serial, atol=2)
+
+# resume from checkpoint, the first shard must not be decoded again
+            checkpoint_dir = os.path.join(tmp_dir, 'checkpoint')
+            os.mkdir(checkpoint_dir)
+            pcm, state = decoder.decode_shard([], 0)
+            for seed in (0, 1):
+                with open(decoder.shard_checkpoint_name(checkpoint_dir, in_file_name,
+                        'resumed.raw', 0, 7, 10, seed), 'wb') as f:
+                    pickle.dump((np.zeros((7, 160), dtype=np.int16), state), f)
+            resumed = decode('resumed.raw', shard_frames=7, overlap=10,
+                    checkpoint_dir=checkpoint_dir)
+            np.testing.assert_array_equal(resumed[:7*160], 0)
+            np.testing.assert_array_equal(resumed[7*160:], sharded[7*160:])
+# checkpoint of other parameters is not used
+            self.assertEqual(len(os.listdir(checkpoint_dir)), 1)
+            resumed = decode('resumed.raw', shard_frames=7, overlap=10,
+                    checkpoint_dir=checkpoint_dir)
+            np.testing.assert_array_equal(resumed, sharded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+from voice_frame import VoiceFrame
+import decoder
+import frame_container
+import json
+import numpy as np
+import os
+import tempfile
+import unittest
+
+
+class TestFrameContainer(unittest.TestCase):
+    frames = [bytes(frame) for frame in
+            np.random.default_rng(0).integers(0, 256, (100, 15), dtype=np.uint8)]
+
+    def _log(self, file_name):
+        with open(file_name, 'wt') as f:
+            for i, data in enumerate(TestFrameContainer.frames):
+                print(json.dumps({'event': 'sync', 'frame_no': i}), file=f)
+                frame = {'type': 'VOICE', 'data': {'encoding': 'hex',
+                    'value': (data + b'\0').hex()}}
+                print(json.dumps({'event': 'frame', 'frame_no': 2*i, 'frame': frame}),
+                        file=f)
+
+    def test_container(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_name = os.path.join(tmp_dir, 'call.json')
+            container_name = os.path.join(tmp_dir, 'call.rpf')
+            self._log(log_name)
+            self.assertEqual(frame_container.convert(log_name, container_name,
+                index_step=7), 100)
+            self.assertTrue(frame_container.is_container(container_name))
+            self.assertFalse(frame_container.is_container(log_name))
+
+            container = frame_container.FrameContainer(container_name)
+            self.assertEqual(len(container), 100)
+            self.assertEqual([bytes(f) for f in container.frames()],
+                    TestFrameContainer.frames)
+            self.assertIsInstance(container.frame(3), memoryview)
+            self.assertEqual(bytes(container.frame(-1)), TestFrameContainer.frames[-1])
+            np.testing.assert_array_equal(container.records['frame_no'][:3], [0, 2, 4])
+            np.testing.assert_array_equal(VoiceFrame.decode_many(container.data(10, 20)),
+                    VoiceFrame.decode_many(b''.join(TestFrameContainer.frames[10:20])))
+
+            for t in (-1., 0., 0.5, 0.51, 1.99, 10.):
+                self.assertEqual(container.find_time(t),
+                        np.searchsorted(np.arange(100) * 0.02, t))
+
+# decoding of time range reads only requested frames
+            out_name = os.path.join(tmp_dir, 'part.raw')
+            self.assertEqual(decoder.decode_file(container_name, out_name,
+                start_time=0.5, end_time=1.), 25)
+            self.assertEqual(os.path.getsize(out_name), 25 * 160 * 2)
+            self.assertRaises(ValueError, decoder.decode_file, log_name, out_name,
+                    start_time=0.5)
+            self.assertEqual(decoder.decode_file(container_name, out_name), 100)
+
+# frames of several streams can't be decoded by one codec
+            mixed_name = os.path.join(tmp_dir, 'mixed.rpf')
+            data = TestFrameContainer.frames
+            frame_container.write_container(mixed_name,
+                    [(0., 0, 1, data[0]), (0.02, 0, 2, data[1])])
+            self.assertRaises(ValueError, decoder.decode_file, mixed_name, out_name)
+            self.assertRaises(ValueError, frame_container.write_container, mixed_name,
+                    [(0.02, 0, 1, data[0]), (0., 1, 1, data[1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
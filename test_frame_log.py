@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import frame_log
+import gzip
+import io
+import json
+import unittest
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestFrameLog(unittest.TestCase):
+    lines = (
+            {'event': 'frame', 'frame': {'type': 'VOICE',
+                'data': {'encoding': 'hex', 'value': '00112233445566778899aabbccddee'}}},
+            {'event': 'sync', 'info': 'VOICE'},
+            {'event': 'frame', 'frame': {'type': 'DATA',
+                'data': {'encoding': 'hex', 'value': '0011'}}},
+            {'event': 'frame', 'frame': {'type': 'VOICE',
+                'data': {'encoding': 'base64', 'value': 'AAE='}}},
+            {'event': 'frame', 'frame': {'type': 'VOICE',
+                'data': {'encoding': 'hex', 'value': 'ffeeddccbbaa99887766554433221100'}}},
+            )
+    log = ''.join(json.dumps(line) + '\n' for line in lines).encode()
+    frames = [bytes.fromhex('00112233445566778899aabbccddee'),
+            bytes.fromhex('ffeeddccbbaa99887766554433221100'), ]
+
+    def test_iter_voice_frames(self):
+        f = frame_log.decompress(io.BufferedReader(io.BytesIO(TestFrameLog.log)))
+        self.assertEqual(list(frame_log.iter_voice_frames(f)), TestFrameLog.frames)
+
+    def test_voice_frames2array(self):
+        a = frame_log.voice_frames2array(TestFrameLog.frames)
+        self.assertEqual(a.shape, (2, 15))
+        self.assertEqual(a[1].tobytes(), TestFrameLog.frames[1][:15])
+        self.assertEqual(frame_log.voice_frames2array([]).shape, (0, 15))
+# short frames must not shift following frames
+        self.assertRaises(ValueError, frame_log.voice_frames2array,
+                [b'\x00' * 14, b'\x00' * 16])
+
+    def test_gzip(self):
+        f = io.BufferedReader(io.BytesIO(gzip.compress(TestFrameLog.log)))
+        f = frame_log.decompress(f)
+        batches = list(frame_log.iter_voice_frame_batches(f, batch_size=1))
+        self.assertEqual(batches, [[frame] for frame in TestFrameLog.frames])
+
+    class Pipe(io.RawIOBase):
+        """Raw stream returning one byte per read like slowly filled pipe."""
+        def __init__(self, data):
+            self.data = data
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            if not self.data or not len(b):
+                return 0
+            b[0] = self.data[0]
+            self.data = self.data[1:]
+            return 1
+
+    def test_pipe(self):
+        for data in (TestFrameLog.log, gzip.compress(TestFrameLog.log)):
+            raw = io.BufferedReader(TestFrameLog.Pipe(data))
+            with frame_log.decompress(raw) as f:
+                self.assertEqual(list(frame_log.iter_voice_frames(f)),
+                        TestFrameLog.frames)
+            self.assertTrue(raw.closed)
+        for data in (b'', b'\x1f'):
+            with frame_log.decompress(io.BufferedReader(TestFrameLog.Pipe(data))) as f:
+                self.assertEqual(f.read(), data)
+
+    def assert_closes_file(self, data):
+        raw = io.BufferedReader(io.BytesIO(data))
+        with frame_log.decompress(raw) as f:
+            self.assertEqual(list(frame_log.iter_voice_frames(f)), TestFrameLog.frames)
+        self.assertTrue(raw.closed)
+
+    def test_close(self):
+        self.assert_closes_file(gzip.compress(TestFrameLog.log))
+
+    @unittest.skipUnless(zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        self.assert_closes_file(zstandard.ZstdCompressor().compress(TestFrameLog.log))
+
+
+if __name__ == '__main__':
+    unittest.main()
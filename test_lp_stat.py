@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+from lp_stat import LPStat, files_stat
+from rp_celp import Codec
+import numpy as np
+import os
+import tempfile
+import threading
+import unittest
+
+
+class TestLPStat(unittest.TestCase):
+    def test_files_stat(self):
+        t = np.arange(160*50 + 7)
+        samples = (np.sin(t*0.05)*2000 + np.cos(t*0.3)*500).astype(np.int16)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_names = [os.path.join(tmp_dir, 'a.pcm'), os.path.join(tmp_dir, 'b.pcm')]
+            samples.tofile(file_names[0])
+            samples[:160*20].tofile(file_names[1])
+            lp_stat = files_stat(file_names, batch_frames=16)
+            lp_stat_jobs = files_stat(file_names, jobs=2)
+
+        counts = np.zeros((10, LPStat.n_bins), dtype=int)
+        for n_frames in (50, 20):
+            codec = Codec()
+            for frame in samples[:160*n_frames].reshape(-1, 160):
+                for i, idx in enumerate(codec.encode(frame)['lar_idx']):
+                    counts[i, idx] += 1
+
+        self.assertEqual(lp_stat.n_frames, 70)
+        np.testing.assert_array_equal(lp_stat.counts, counts)
+        self.assertEqual(lp_stat_jobs.n_frames, 70)
+        np.testing.assert_array_equal(lp_stat_jobs.counts, counts)
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'named pipes are not supported')
+    def test_pipe(self):
+        """Pipe has no size, it must be read by chunks, not memory mapped."""
+        samples = (np.sin(np.arange(160*30 + 7)*0.05)*2000).astype(np.int16)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'a.pcm')
+            samples.tofile(file_name)
+            lp_stat = files_stat([file_name], max_frames=25)
+            fifo_name = os.path.join(tmp_dir, 'fifo')
+            os.mkfifo(fifo_name)
+
+            def write():
+                with open(fifo_name, 'wb') as f:
+                    f.write(samples.tobytes())
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            lp_stat_pipe = files_stat([fifo_name], batch_frames=8, max_frames=25)
+            writer.join()
+
+        self.assertEqual(lp_stat_pipe.n_frames, 25)
+        np.testing.assert_array_equal(lp_stat_pipe.counts, lp_stat.counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import os
+import pcm_writer
+import tempfile
+import unittest
+import wave
+
+
+class TestPCMWriter(unittest.TestCase):
+    samples = np.linspace(-1.2, 1.2, num=5*160)
+    pcm = np.clip(np.rint(samples * 32767), -32768, 32767).astype(np.int16)
+
+    def _check(self, file_name, n_samples=None, pcm=pcm):
+        writer = pcm_writer.open_pcm(file_name, n_samples=n_samples)
+        for frame in TestPCMWriter.samples.reshape(-1, 160):
+            writer.write(frame)
+        writer.close()
+        if file_name.endswith('.wav'):
+            with wave.open(file_name, 'rb') as f:
+                self.assertEqual(f.getnframes(), len(pcm))
+                data = f.readframes(f.getnframes())
+        else:
+            with open(file_name, 'rb') as f:
+                data = f.read()
+        np.testing.assert_array_equal(np.frombuffer(data, dtype='<i2'), pcm)
+
+    def test_writers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ('out.wav', 'out.raw'):
+                file_name = os.path.join(tmp_dir, name)
+                self._check(file_name)
+                self._check(file_name, n_samples=len(TestPCMWriter.pcm))
+# preallocated for more samples than written
+                self._check(file_name, n_samples=2*len(TestPCMWriter.pcm))
+
+    def test_block_len(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'out.raw')
+            writer = pcm_writer.PCMWriter(file_name, raw=True, block_len=100)
+            writer.write(TestPCMWriter.samples)
+            writer.close()
+            with open(file_name, 'rb') as f:
+                np.testing.assert_array_equal(np.frombuffer(f.read(), dtype='<i2'),
+                        TestPCMWriter.pcm)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+from profiling import Profiler, null_profiler
+from rp_celp import Codec
+import decoder
+import io
+import json
+import numpy as np
+import os
+import tempfile
+import test_decoder
+import unittest
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profiler(self):
+        profiler = Profiler()
+        profiler.add('a', 3e-6)
+        profiler.add('a', 1., items=10)
+        with profiler.stage('b', items=5):
+            pass
+        self.assertEqual(profiler.stages['a']['calls'], 2)
+        self.assertEqual(profiler.stages['a']['items'], 11)
+        self.assertEqual(sum(profiler.stages['a']['histogram']), 2)
+
+        profiler2 = Profiler()
+        profiler2.add('a', 2e-6)
+        profiler2.merge(profiler)
+        self.assertEqual(profiler2.stages['a']['calls'], 3)
+        self.assertEqual(profiler2.stages['b']['items'], 5)
+
+        out = io.StringIO()
+        profiler.dump_json(out)
+        self.assertEqual(json.loads(out.getvalue())['stages']['b']['calls'], 1)
+        out = io.StringIO()
+        profiler.dump_prometheus(out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('rp_celp_stage_items_total{stage="a"} 11', lines)
+        self.assertIn('rp_celp_stage_seconds_bucket{stage="a",le="+Inf"} 2', lines)
+        self.assertIn('rp_celp_stage_seconds_count{stage="b"} 1', lines)
+
+        with null_profiler.stage('a'):
+            pass
+        self.assertEqual(null_profiler.stages, {})
+
+    def test_codec_stages(self):
+        codec = Codec()
+        codec.profiler = Profiler()
+        r = codec.encode(np.zeros(160))
+        subframe = {'stochastic_gain': 0}
+        codec.decode(r['lar_idx'], subframe, subframe, subframe)
+        self.assertEqual(set(codec.profiler.stages), {'autocorrelate', 'refl_coefs',
+            'quantize', 'dequantize', 'interpolate', 'analysis_filtering',
+            'subframe_search', 'noise', 'synthesis_filtering', })
+        self.assertEqual(codec.profiler.stages['interpolate']['calls'], 2)
+        self.assertIs(Codec.profiler, null_profiler)
+
+    def test_decode_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i in range(2):
+                in_file_name = os.path.join(tmp_dir, 'call%d.json' % i)
+                test_decoder.TestDecoder._log(in_file_name, 3)
+                files.append((in_file_name, os.path.join(tmp_dir, 'call%d.wav' % i)))
+            profiler = Profiler()
+            results = decoder.decode_files(files, jobs=2, profiler=profiler)
+        self.assertEqual([r[2] for r in results], [3, 3])
+        self.assertEqual(profiler.stages['json_parse']['items'], 6)
+        self.assertEqual(profiler.stages['bit_unpack']['items'], 6)
+        self.assertEqual(profiler.stages['synthesis_filtering']['items'], 6)
+        self.assertIn('pcm_pack', profiler.stages)
+        self.assertIn('write', profiler.stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,8 @@
 from numpy.testing import assert_almost_equal
 from rp_celp import Codec
 import numpy as np
+import pickle
+import tracemalloc
 import unittest
 
 
@@ -34,6 +36,13 @@ class TestCodec(unittest.TestCase):
                 [ 6.4, 6.36, 6.32, 6.28, 6.24, 6.2, 6.16, 6.12, 6.08, 6.04, 6.],
                 decimal=3)
 
+        frames = np.array((TestCodec.sin440, TestCodec.silence,
+            TestCodec.silence2, TestCodec.sin2000)) / (2**12-1)
+        r = codec.autocorrelate(frames)
+        np.testing.assert_array_equal(r, [codec.autocorrelate(f) for f in frames])
+        np.testing.assert_array_equal(codec.autocorr2refl_coeffs(r),
+                [codec.autocorr2refl_coeffs(a) for a in r])
+
     def test_coder_decoder(self):
         codec = Codec()
 
@@ -102,6 +111,259 @@ class TestCodec(unittest.TestCase):
         r2 = codec.short_term_synthesis_filtering(r, refl_coefs)
         TestCodec._csv(r2, name='synthesis')
 
+    def test_encode_frames(self):
+        frames = np.array((TestCodec.sin50, TestCodec.sin220, TestCodec.silence,
+            TestCodec.sin440, TestCodec.sin900, TestCodec.silence2,
+            TestCodec.sin1000, TestCodec.sin2000, ))
+        frames = np.round(frames).astype(np.int16)
+
+        codec = Codec()
+        lar_idxs = [codec.encode(frame)['lar_idx'] for frame in frames]
+
+        codec_frames = Codec()
+        r = codec_frames.encode_frames(frames)
+        np.testing.assert_array_equal(r, lar_idxs)
+        np.testing.assert_array_equal(codec.old_lars, codec_frames.old_lars)
+        np.testing.assert_array_equal(codec.prec, codec_frames.prec)
+        self.assertEqual(codec.s_prev, codec_frames.s_prev)
+
+        codec_stream = Codec()
+        r = np.concatenate(list(codec_stream.encode_stream(frames, batch_size=3)))
+        np.testing.assert_array_equal(r, lar_idxs)
+        np.testing.assert_array_equal(codec.prec, codec_stream.prec)
+        self.assertEqual(codec.s_prev, codec_stream.s_prev)
+
+# encode() after encode_frames() does not depend on how earlier frames were
+# encoded, subframe search state is reset
+        codec_mixed = Codec()
+        codec_mixed.encode(frames[0])
+        self.assertTrue(codec_mixed.exc.any())
+        codec_mixed.encode_frames(frames[1:4])
+        self.assertFalse(codec_mixed.exc.any())
+        self.assertFalse(codec_mixed.syn_mem.any())
+        codec_frames = Codec()
+        codec_frames.encode_frames(frames[:4])
+        r_mixed = codec_mixed.encode(frames[4])
+        r = codec_frames.encode(frames[4])
+        np.testing.assert_array_equal(r_mixed.pop('lar_idx'), r.pop('lar_idx'))
+        self.assertEqual(r_mixed, r)
+
+    def test_filter_backends(self):
+        """lfilter backend must match reference lattice filters, differences
+        are caused only by rounding, so relative tolerance 1e-9 is used."""
+        frames = (TestCodec.sin220, TestCodec.sin440, TestCodec.sin1000,
+                TestCodec.sin2000, TestCodec.sin900, TestCodec.silence2, )
+        codec = Codec(approx=False, filter_backend='python')
+        codec_lfilter = Codec(approx=False, filter_backend='lfilter')
+        for frame in frames:
+            samples = frame / (2**12 - 1)
+            lar_idx = codec.lars2lar_idxs(codec.refl_coefs2lars(
+                codec.autocorr2refl_coeffs(codec.autocorrelate(samples))))
+            r = []
+            for c in (codec, codec_lfilter):
+                lars3 = c.lar_interpolate(c.lar_idxs2lars(lar_idx))
+                refl_coefs = [c.lar2refl_coef(lars) for lars in lars3]
+                d = c.short_term_analysis_filtering(c.win_shift(samples), refl_coefs)
+                s = c.short_term_synthesis_filtering(d[1:], refl_coefs)
+                r.append((d, s))
+            np.testing.assert_allclose(r[1][0], r[0][0], rtol=1e-9,
+                    atol=1e-9 * abs(r[0][0]).max())
+            np.testing.assert_allclose(r[1][1], r[0][1], rtol=1e-9,
+                    atol=1e-9 * abs(r[0][1]).max())
+        np.testing.assert_allclose(codec_lfilter.v, codec.v, rtol=1e-9, atol=1e-12)
+        self.assertEqual(codec.s_prev, codec_lfilter.s_prev)
+
+        self.assertRaises(ValueError, Codec, filter_backend='unknown')
+
+    def test_noise_table(self):
+        codec1 = Codec(seed=1)
+        codec2 = Codec(seed=1)
+        self.assertIs(codec1.noise, codec2.noise)
+        self.assertFalse(codec1.noise.flags.writeable)
+        self.assertIsNot(codec1.noise, Codec(seed=2).noise)
+
+        r = codec1.encode(TestCodec.sin440)
+        subframe = {'stochastic_gain': 0}
+        s1 = codec1.decode(r['lar_idx'], subframe, subframe, subframe)
+        s2 = codec2.decode(r['lar_idx'], subframe, subframe, subframe)
+        np.testing.assert_array_equal(s1, s2)
+        self.assertEqual(codec1.noise_offs, 160)
+
+    def test_lar_quantizer(self):
+        lars = np.random.default_rng(0).uniform(-3, 3, size=(100, 10))
+        lar_idx = Codec.quantizer.quantize(lars)
+        for i, levels in enumerate(Codec.LAR_idx):
+            nearest = abs(lars[:, i, None] - levels).argmin(axis=1)
+            np.testing.assert_array_equal(lar_idx[:, i], nearest)
+            np.testing.assert_array_equal(Codec.quantizer.dequantize(lar_idx)[:, i],
+                    levels[nearest])
+
+        for approx in (True, False):
+            codec = Codec(approx=approx)
+            codec_ref = Codec(approx=approx)
+            for idx in np.concatenate((lar_idx[:10], lar_idx[:10])):
+                r = codec.lar_idxs2refl_coefs(idx)
+                lars3 = codec_ref.lar_interpolate(codec_ref.lar_idxs2lars(idx))
+                np.testing.assert_array_equal(r,
+                        [codec_ref.lar2refl_coef(lars) for lars in lars3])
+            np.testing.assert_array_equal(codec.old_lars, codec_ref.old_lars)
+
+    def test_state(self):
+        codec = Codec(seed=0)
+        codec.encode(TestCodec.sin440)
+        subframe = {'stochastic_gain': 0}
+        lar_idx = codec.encode(TestCodec.sin900)['lar_idx']
+        codec.decode(lar_idx, subframe, subframe, subframe)
+        state = pickle.loads(pickle.dumps(codec.get_state()))
+
+        codec_restored = Codec(seed=0)
+        codec_restored.set_state(state)
+        for c in (codec, codec_restored):
+            c.encode(TestCodec.sin220)
+        np.testing.assert_array_equal(
+                codec.decode(lar_idx, subframe, subframe, subframe),
+                codec_restored.decode(lar_idx, subframe, subframe, subframe))
+        self.assertEqual(codec.noise_offs, Codec.noise_offs_at(2))
+
+    def test_decode_frames(self):
+        rng = np.random.default_rng(0)
+        lar_idx = np.stack([rng.integers(0, len(levels), size=30)
+            for levels in Codec.LAR_idx], axis=1)
+        for approx in (True, False):
+            codec = Codec(approx=approx, seed=0)
+            codec_frames = Codec(approx=approx, seed=0)
+# noise position wraps within the second batch
+            codec.noise_offs = codec_frames.noise_offs = Codec.noise_offs_at(9985)
+            for batch in (lar_idx[:1], lar_idx[1:20], lar_idx[20:], lar_idx[:0]):
+                r = [codec.decode(idx) for idx in batch]
+                s = codec_frames.decode_frames(batch, np.zeros((len(batch), 3)))
+                self.assertEqual(s.shape, (len(batch), 160))
+                np.testing.assert_array_equal(s, np.reshape(r, (-1, 160)))
+                np.testing.assert_array_equal(codec.old_lars, codec_frames.old_lars)
+                np.testing.assert_array_equal(codec.v, codec_frames.v)
+                self.assertEqual(codec.noise_offs, codec_frames.noise_offs)
+        self.assertRaises(ValueError, codec.decode_frames, lar_idx, np.zeros((2, 3)))
+
+    def test_search_subframes(self):
+        frames = np.concatenate((TestCodec.sin220, TestCodec.sin440,
+            TestCodec.sin440, TestCodec.sin900, TestCodec.sin900)).reshape(5, 160)
+        codec = Codec()
+        err = energy = 0
+        for frame in frames / (2**12-1):
+            lp = codec.lp_analysis(frame)
+            subframes, y = codec.search_subframes(frame, lp['refl_coefs'])
+            err += np.sum((frame - y)**2)
+            energy += np.sum(frame**2)
+        self.assertGreater(10*np.log10(energy / err), 5)
+        for sf, subframe in enumerate(subframes):
+            self.assertLess(subframe['LTP_lag'], 256)
+            self.assertLess(subframe['LTP_gain'], len(Codec.ltp_gains))
+            self.assertLess(subframe['stochastic_gain'], len(Codec.QLBG))
+            self.assertLess(subframe['st_dec'], len(Codec.rp_spacing))
+            self.assertLess(subframe['st_sig_ph'], 1 << Codec.st_sig_ph_bits[sf])
+# periodic signal is predicted by LTP
+        self.assertGreater(subframes[0]['LTP_gain'], 0)
+
+# regular pulse codebook vectors
+        C = Codec.stochastic_codebook(48, 9)
+        self.assertEqual(C.shape, (len(Codec.rp_spacing), 512, 48))
+        np.testing.assert_array_equal(np.flatnonzero(C[1, 6]), np.arange(2, 48, 4))
+
+    def test_precision(self):
+        with self.assertRaises(ValueError):
+            Codec(precision='float16')
+        with self.assertRaises(ValueError):
+            Codec(approx=False, precision='fixed')
+
+# fixed point LAR conversions follow float approximations
+        lars = np.linspace(-1.6, 1.6, 101)
+        np.testing.assert_allclose(Codec.lar2refl_coef_fixed(
+            Codec.lars2fixed(lars)) / 2**15, Codec.lar2refl_coef_approx(lars),
+            atol=1e-4)
+        refl_coefs = np.linspace(-0.999, 0.999, 101)
+        np.testing.assert_allclose(Codec.refl_coefs2lars_fixed(
+            Codec.float2fixed(refl_coefs)) / 2**14,
+            Codec().refl_coefs2lars_approx(refl_coefs), atol=1e-3)
+
+        t = np.arange(160*30)
+        samples = (np.sin(2*np.pi*t*(200 + t/50)/Codec.samp_rate) * 2000).reshape(30, 160)
+        lar_idxs = Codec().encode_frames(samples)
+        reference = Codec(seed=0).decode_frames(lar_idxs)
+        for precision, min_snr in (('float32', 80), ('fixed', 25), ):
+            codec = Codec(seed=0, precision=precision)
+            s = np.array([codec.decode(lar_idx) for lar_idx in lar_idxs])
+            snr = 10*np.log10(np.sum(reference**2) / np.sum((reference - s)**2))
+            self.assertGreater(snr, min_snr, precision)
+            np.testing.assert_array_equal(
+                    Codec(seed=0, precision=precision).decode_frames(lar_idxs), s)
+            self.assertEqual(codec.noise.nbytes,
+                    Codec.noise_table(0).nbytes // (2 if precision == 'float32' else 4))
+            np.testing.assert_array_equal(
+                    Codec(precision=precision).encode_frames(samples), lar_idxs)
+            np.testing.assert_array_equal(
+                    Codec(precision=precision).encode(samples[0])['lar_idx'], lar_idxs[0])
+        self.assertEqual(Codec(precision='float32').decode(lar_idxs[0]).dtype, np.float32)
+
+    def test_reuse_buffers(self):
+        frames = (TestCodec.sin220, TestCodec.sin440, TestCodec.sin900,
+                TestCodec.silence2, TestCodec.sin2000, )
+        lar_idxs = Codec(approx=False).encode_frames(frames)
+        codec = Codec(approx=False, seed=0)
+        codec_reuse = Codec(approx=False, seed=0, reuse_buffers=True)
+        outputs = []
+        for frame, lar_idx in zip(frames, lar_idxs):
+            np.testing.assert_array_equal(codec_reuse.encode(frame)['lar_idx'],
+                    codec.encode(frame)['lar_idx'])
+            s = codec_reuse.decode(lar_idx)
+            np.testing.assert_array_equal(s, codec.decode(lar_idx))
+            outputs.append(s)
+        self.assertIs(outputs[0], outputs[-1])
+        out = np.empty(160)
+        self.assertIs(codec_reuse.decode(lar_idxs[0], out=out), out)
+        np.testing.assert_array_equal(out, codec.decode(lar_idxs[0]))
+
+        def traced(codec, fnc, n=4):
+            """Return memory growth during n repetitions of frames in steady
+            state and peak of temporary allocations."""
+            def repeat(n):
+                for i in range(n):
+                    for frame, lar_idx in zip(frames, lar_idxs):
+                        fnc(codec, frame, lar_idx)
+            repeat(1)
+# numpy keeps freed small arrays in its cache, warm up also the cache
+            tracemalloc.start()
+            repeat(1)
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            repeat(n)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return current - start, peak - start
+
+        encode = lambda c, frame, lar_idx: c.encode(frame)
+        decode = lambda c, frame, lar_idx: c.decode(lar_idx)
+# work buffers are not reallocated, previous LARs swap with buffer 'lars'
+# each frame, even number of frames returns them in place
+        buffers, old_lars = dict(codec_reuse.buffers), codec_reuse.old_lars
+        self.assertIn('synthesis', buffers)
+        self.assertIn('search_H0', buffers)
+        for frame, lar_idx in zip(frames + frames, np.concatenate((lar_idxs, lar_idxs))):
+            codec_reuse.encode(frame)
+            codec_reuse.decode(lar_idx)
+        self.assertEqual(list(codec_reuse.buffers), list(buffers))
+        for name, buffer in buffers.items():
+            self.assertIs(codec_reuse.buffers[name], buffer, name)
+        self.assertIs(codec_reuse.old_lars, old_lars)
+
+        for fnc in (encode, decode):
+            growth, peak = traced(codec_reuse, fnc)
+# kept array would take more than 100 B per frame
+            self.assertLess(growth, 256)
+            growth, peak_default = traced(codec, fnc)
+            self.assertLess(peak, peak_default / 3)
+# decode allocates no frame sized array
+        self.assertLess(traced(codec_reuse, decode)[1], 160 * 8)
+
     @staticmethod
     def _csv(row, name=None):
         if name is not None:
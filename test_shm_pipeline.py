@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import decoder
+import frame_log
+import numpy as np
+import os
+import shm_pipeline
+import tempfile
+import test_decoder
+import threading
+import unittest
+
+
+class TestSharedRing(unittest.TestCase):
+    def test_ring(self):
+        ring = shm_pipeline.SharedRing(shm_pipeline.frames_slot_dtype(4), 2)
+        try:
+            self.assertIsNone(ring.get(timeout=0))
+            received = []
+
+            def consume():
+                for i in range(5):
+                    slot = ring.get()
+                    received.append((int(slot['stream']), int(slot['n'])))
+                    ring.release()
+
+# producer waits for consumer when both slots are filled
+            consumer = threading.Thread(target=consume)
+            consumer.start()
+            for i in range(5):
+                ring.put(i, shm_pipeline.FRAMES, i + 1)
+            consumer.join()
+            self.assertEqual(received, [(i, i + 1) for i in range(5)])
+        finally:
+            ring.unlink()
+
+
+class TestPipeline(unittest.TestCase):
+    def test_decode_files_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i, n_frames in enumerate((40, 3, 0, 25)):
+                in_file_name = os.path.join(tmp_dir, 'call%d.json' % i)
+                test_decoder.TestDecoder._log(in_file_name, n_frames)
+                files.append((in_file_name, os.path.join(tmp_dir, 'call%d.raw' % i)))
+            files.append((os.path.join(tmp_dir, 'missing.json'),
+                os.path.join(tmp_dir, 'missing.raw')))
+# failure of writer is reported for its file only
+            files.append((files[0][0], os.path.join(tmp_dir, 'nodir', 'call0.raw')))
+
+# small rings exercise wrap around and backpressure
+            results = shm_pipeline.decode_files_pipeline(files, workers=2,
+                    batch_frames=4, n_slots=2, seed=0)
+            self.assertEqual([r[2] for r in results], [40, 3, 0, 25, 0, 0])
+            self.assertEqual([r[4] is None for r in results], [True] * 4 + [False] * 2)
+            self.assertIn('FileNotFoundError', results[-2][4])
+            self.assertIn('FileNotFoundError', results[-1][4])
+            for in_file_name, out_file_name in files[:4]:
+                with frame_log.open_log(in_file_name) as f:
+                    frames = [data for batch in frame_log.iter_voice_frame_batches(f)
+                            for data in batch]
+                pcm, _ = decoder.decode_shard(frames, 0, seed=0)
+                np.testing.assert_array_equal(
+                        np.fromfile(out_file_name, dtype=np.int16), pcm.ravel())
+
+
+if __name__ == '__main__':
+    unittest.main()
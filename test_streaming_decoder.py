@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+from rp_celp import Codec
+from streaming_decoder import StreamingDecoder
+import asyncio
+import json
+import numpy as np
+import os
+import threading
+import time
+import unittest
+
+
+class TestStreamingDecoder(unittest.TestCase):
+    frame_period = 1. / 50
+# p99 of frame latency from pipe write to PCM output, wall clock latency
+# depends on load of machine, it is checked only if TIMING_TESTS is set
+    max_latency = 0.02
+    timing_tests = bool(os.environ.get('TIMING_TESTS'))
+
+    frames = [bytes(frame) for frame in
+            np.random.default_rng(0).integers(0, 256, (50, 15), dtype=np.uint8)]
+
+    def test_feed(self):
+        decoder = StreamingDecoder(jitter_frames=2, block_frames=2, codec=Codec(seed=0))
+        data = b''.join(TestStreamingDecoder.frames[:5])
+        blocks = []
+        for i in range(0, len(data), 7):
+            blocks += decoder.feed(data[i:i + 7])
+        self.assertEqual([len(b) for b in blocks], [320, ])
+        blocks += decoder.flush()
+        self.assertEqual([len(b) for b in blocks], [320, 320, 160])
+        self.assertEqual(blocks[0].dtype, np.int16)
+
+        codec = Codec(seed=0)
+        json_decoder = StreamingDecoder(json=True, block_frames=5, codec=codec)
+        log = b''
+        for frame in TestStreamingDecoder.frames[:5]:
+            log += json.dumps({'event': 'frame', 'frame': {'type': 'VOICE',
+                'data': {'encoding': 'hex', 'value': frame.hex()}}}).encode() + b'\n'
+        json_blocks = json_decoder.feed(log[:100]) + json_decoder.feed(log[100:])
+        np.testing.assert_array_equal(json_blocks[0], np.concatenate(blocks))
+        self.assertEqual(json_decoder.latency_stats()['frames'], 5)
+
+# the last line without newline is decoded by flush(), incomplete one dropped
+        json_decoder = StreamingDecoder(json=True, codec=Codec(seed=0))
+        lines = log.split(b'\n')
+        json_blocks = json_decoder.feed(lines[0] + b'\n' + lines[1])
+        json_blocks += json_decoder.flush()
+        self.assertEqual(json_decoder.n_frames, 2)
+        np.testing.assert_array_equal(np.concatenate(json_blocks),
+                np.concatenate(blocks)[:320])
+        json_decoder.feed(lines[2][:20])
+        self.assertEqual(json_decoder.flush(), [])
+
+    def test_pipe_replay(self):
+        """Replay frames through pipe in real time, all frames must be
+        decoded faster than they come."""
+        r, w = os.pipe()
+        send_times = []
+
+        def writer():
+            with os.fdopen(w, 'wb', buffering=0) as f:
+                start = time.perf_counter()
+                for i, frame in enumerate(TestStreamingDecoder.frames):
+                    delay = start + i * TestStreamingDecoder.frame_period - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    send_times.append(time.perf_counter())
+                    f.write(frame)
+
+        async def reader():
+            loop = asyncio.get_running_loop()
+            stream_reader = asyncio.StreamReader()
+            protocol = asyncio.StreamReaderProtocol(stream_reader)
+            transport, _ = await loop.connect_read_pipe(lambda: protocol,
+                    os.fdopen(r, 'rb'))
+            recv_times = []
+            try:
+                async for block in decoder.decode_stream(stream_reader):
+                    recv_times.append(time.perf_counter())
+            finally:
+                transport.close()
+            return recv_times
+
+        decoder = StreamingDecoder()
+# noise table is created on first decode, do not count it into latency
+        decoder.codec.noise
+        thread = threading.Thread(target=writer)
+        thread.start()
+        recv_times = asyncio.run(reader())
+        thread.join()
+
+        self.assertEqual(len(recv_times), len(TestStreamingDecoder.frames))
+        self.assertLess(decoder.latency_stats()['p99'], TestStreamingDecoder.frame_period)
+        if TestStreamingDecoder.timing_tests:
+            latency = np.array(recv_times) - np.array(send_times)
+            self.assertLess(np.percentile(latency, 99), TestStreamingDecoder.max_latency)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+from rp_celp import Codec
+from voice_frame import FrameRing, VoiceFrame
+import argparse
+import contextlib
+import io
+import numpy as np
+import os
+import tempfile
+import tracemalloc
+import unittest
+import voice_frame
+
+
+class TestVoiceFrame(unittest.TestCase):
+    @staticmethod
+    def _frame(values):
+        """Pack dictionary of coefficient values into frame bytes."""
+        data = [0, ] * 8 * VoiceFrame.frame_len
+        for name, bits in VoiceFrame.coeffs.items():
+            value = values[name]
+            for bit in reversed(bits):
+                data[bit] = value & 1
+                value >>= 1
+        frame = bytearray(VoiceFrame.frame_len)
+        for i, bit in enumerate(data):
+            frame[i // 8] |= bit << (i % 8)
+        return bytes(frame)
+
+    def test_values(self):
+        values = {name: (i * 7) % (1 << len(bits))
+                for i, (name, bits) in enumerate(VoiceFrame.coeffs.items())}
+        frame = VoiceFrame(TestVoiceFrame._frame(values))
+        self.assertEqual(frame.values, values)
+        self.assertEqual(frame.get_lars(),
+                {name: values[name] for name in values if name.startswith('LAR')})
+
+        frame = VoiceFrame(b'\xff' * VoiceFrame.frame_len)
+        for name, bits in VoiceFrame.coeffs.items():
+            self.assertEqual(frame.values[name], (1 << len(bits)) - 1)
+
+    def test_decode_many(self):
+        rng = np.random.default_rng(0)
+        buf = rng.integers(0, 256, size=10 * VoiceFrame.frame_len,
+                dtype=np.uint8).tobytes()
+        records = VoiceFrame.decode_many(buf)
+        self.assertEqual(records.shape, (10, ))
+        for i in range(10):
+            frame = VoiceFrame(buf[i*VoiceFrame.frame_len:(i+1)*VoiceFrame.frame_len])
+            for name in VoiceFrame.coeffs:
+                self.assertEqual(records[name][i], frame.values[name])
+
+    def test_encode_many(self):
+        rng = np.random.default_rng(0)
+        frames = rng.integers(0, 256, size=(10, VoiceFrame.frame_len), dtype=np.uint8)
+        np.testing.assert_array_equal(
+                VoiceFrame.encode_many(VoiceFrame.decode_many(frames)), frames)
+
+        for name, bits in VoiceFrame.coeffs.items():
+            if name.startswith('st') and name.endswith('_sig_ph'):
+                self.assertEqual(len(bits), Codec.st_sig_ph_bits[int(name[2]) - 1])
+        params = Codec().encode(np.sin(np.arange(160) / 5) * 1000)
+        record = VoiceFrame.params2record(params)
+        frame = VoiceFrame(VoiceFrame.encode_many(record)[0].tobytes())
+        self.assertEqual(frame.record, record)
+        self.assertEqual(frame.values['LTP2_lag'], params['subframe2']['LTP_lag'])
+        self.assertEqual(frame.values['st3_sig_ph'], params['subframe3']['st_sig_ph'])
+        np.testing.assert_array_equal(
+                [frame.values[name] for name in Codec.lar_fields], params['lar_idx'])
+
+    def test_export(self):
+        rng = np.random.default_rng(0)
+        frames = rng.integers(0, 256, size=(30, VoiceFrame.frame_len), dtype=np.uint8)
+        records = VoiceFrame.decode_many(frames)
+        fields = ('st2_dec', 'LAR03', 'LTP1_lag', )
+        projected = VoiceFrame.decode_many(frames, fields)
+        self.assertEqual(projected.dtype.names, fields)
+        for name in fields:
+            np.testing.assert_array_equal(projected[name], records[name])
+        with self.assertRaises(ValueError):
+            VoiceFrame.decode_many(frames, ('LAR11', ))
+        self.assertEqual(voice_frame.field_list('st2_dec,LAR03'), ['st2_dec', 'LAR03'])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            voice_frame.field_list('LAR01,LAR11')
+
+# bulk CSV is same as output of print_cvs() for each frame
+        fields = sorted(VoiceFrame.coeffs)
+        expected = io.StringIO()
+        with contextlib.redirect_stdout(expected):
+            for i, record in enumerate(records):
+                voice_frame.print_cvs(dict(zip(VoiceFrame.dtype.names,
+                    record.item())), i == 0)
+        out = io.StringIO()
+        batches = (VoiceFrame.decode_many(frames[i:i + 8], fields)
+                for i in range(0, len(frames), 8))
+        self.assertEqual(voice_frame.write_csv(out, batches, fields), 30)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'frames.npz')
+            self.assertEqual(voice_frame.write_npz(file_name,
+                [projected[:10], projected[10:]], projected.dtype.names), 30)
+            with np.load(file_name) as columns:
+                self.assertEqual(sorted(columns.files), sorted(projected.dtype.names))
+                np.testing.assert_array_equal(columns['LTP1_lag'], records['LTP1_lag'])
+
+    def test_frame_ring(self):
+        rng = np.random.default_rng(0)
+        records = VoiceFrame.decode_many(rng.integers(0, 256,
+            size=10 * VoiceFrame.frame_len, dtype=np.uint8).tobytes())
+        ring = FrameRing(4)
+        ring.append(records[0])
+        self.assertEqual(len(ring), 1)
+        self.assertEqual(ring[0], records[0])
+        ring.extend(records[1:3])
+        np.testing.assert_array_equal(ring.to_array(), records[:3])
+        ring.extend(records[3:9])
+        ring.append(records[9])
+        np.testing.assert_array_equal(ring.to_array(), records[6:])
+        self.assertEqual(ring[-1], records[9])
+        self.assertRaises(IndexError, ring.__getitem__, 4)
+
+    def test_memory(self):
+        """Memory of 1000 buffered frames: parsed frames with bits and
+        dictionary of values (former representation), VoiceFrame objects
+        and FrameRing."""
+        frames = [bytes(frame) for frame in np.random.default_rng(0).integers(
+            0, 256, (1000, VoiceFrame.frame_len), dtype=np.uint8)]
+
+        def measure(fnc):
+            tracemalloc.start()
+            kept = fnc()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del kept
+            return size
+
+        def dicts():
+            parsed = []
+            for frame in frames:
+                f = VoiceFrame(frame)
+                parsed.append((f.data, f.values, [f.values['LAR%02d' % i]
+                    for i in range(1, 11)]))
+            return parsed
+
+        def ring():
+            ring = FrameRing(len(frames))
+            for frame in frames:
+                ring.append(VoiceFrame(frame).record)
+            return ring
+
+        before = measure(dicts)
+        objects = measure(lambda: [VoiceFrame(frame) for frame in frames])
+        after = measure(ring)
+        self.assertLess(objects, before / 2)
+        self.assertLess(after, 100 * len(frames))
+        self.assertLess(after, before / 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
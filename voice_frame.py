@@ -1,11 +1,35 @@
 #!/usr/bin/env python3
 
-from binascii import unhexlify
-import json
+from functools import lru_cache
+import argparse
+import frame_container
+import frame_log
 import numpy as np
 import sys
 
 
+def compile_coeffs(coeffs, n_bits):
+    """Return (n_bits, len(coeffs)) matrix of bit weights, multiplication
+    of frame bits by this matrix gives coefficient values."""
+    weights = np.zeros((n_bits, len(coeffs)), dtype=np.uint16)
+    for i, bits in enumerate(coeffs.values()):
+        for j, bit in enumerate(bits):
+            weights[bit, i] = 1 << (len(bits) - j - 1)
+    return weights
+
+
+def compile_bit_positions(coeffs, n_bits):
+    """Return (field index, shift) pairs of every frame bit, bit value is
+    (field >> shift) & 1. Unused bits are taken from field 0 shifted out."""
+    fields = np.zeros(n_bits, dtype=np.intp)
+    shifts = np.full(n_bits, 16, dtype=np.uint16)
+    for i, bits in enumerate(coeffs.values()):
+        for j, bit in enumerate(bits):
+            fields[bit] = i
+            shifts[bit] = len(bits) - j - 1
+    return fields, shifts
+
+
 class VoiceFrame:
     coeffs = {
             'LAR01': (1, 0, 23, 22, 21, 20),
@@ -38,42 +62,177 @@ class VoiceFrame:
             'st3_sig_ph': (111, 110, 118, 117, 116, 115, 114, 113, 112),
             }
 
+    frame_len = 15
+    dtype = np.dtype([(name, np.uint16) for name in coeffs])
+    weights = compile_coeffs(coeffs, 8*frame_len)
+    bit_fields, bit_shifts = compile_bit_positions(coeffs, 8*frame_len)
+
+# frame keeps only raw data and record, bits and dictionary of values are
+# created on access
+    __slots__ = ('frame', 'record', )
+
     def __init__(self, frame):
         """frame should be byte array with frame data."""
-        self.data = []
-        for b in frame:
-            for i in range(8):
-                self.data.append(b & 1)
-                b >>= 1
-
-        self.values = {}
-        for name, bits in VoiceFrame.coeffs.items():
-            value = '0'
-            for bit in bits:
-                value += str(self.data[bit])
-            self.values[name] = int(value, 2)
+        self.frame = np.frombuffer(frame, dtype=np.uint8, count=VoiceFrame.frame_len)
+        bits = np.unpackbits(self.frame, bitorder='little')
+        self.record = (bits @ VoiceFrame.weights).view(VoiceFrame.dtype)[0]
+
+    @property
+    def data(self):
+        """Array of 120 frame bits."""
+        return np.unpackbits(self.frame, bitorder='little')
+
+    @property
+    def values(self):
+        """Dictionary of coefficient values."""
+        return dict(zip(VoiceFrame.dtype.names, self.record.item()))
+
+    @staticmethod
+    def decode_many(buf, fields=None):
+        """Decode buffer with N consecutive frames or (N, 15) uint8 array,
+        return structured array with N records of coefficients. Records
+        contain only coefficients listed in fields if given."""
+        if isinstance(buf, np.ndarray):
+            frames = buf.reshape(-1, VoiceFrame.frame_len)
+        else:
+            frames = np.frombuffer(buf, dtype=np.uint8).reshape(-1, VoiceFrame.frame_len)
+        bits = np.unpackbits(frames, axis=1, bitorder='little')
+        if fields is None:
+            return (bits @ VoiceFrame.weights).view(VoiceFrame.dtype)[:, 0]
+        weights, dtype = VoiceFrame.projection(tuple(fields))
+        return (bits @ weights).view(dtype)[:, 0]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def projection(fields):
+        """Return bit weights and record dtype of coefficients in fields."""
+        unknown = [name for name in fields if name not in VoiceFrame.coeffs]
+        if unknown:
+            raise ValueError('Unknown VOICE frame field: %s' % ', '.join(unknown))
+        idx = [VoiceFrame.dtype.names.index(name) for name in fields]
+        dtype = np.dtype([(name, np.uint16) for name in fields])
+        return np.ascontiguousarray(VoiceFrame.weights[:, idx]), dtype
+
+    @staticmethod
+    def encode_many(records):
+        """Pack structured array of N records (VoiceFrame.dtype) into
+        (N, 15) uint8 array of frames, inverse of decode_many()."""
+        records = np.atleast_1d(records)
+        values = records.view(np.uint16).reshape(len(records), -1).astype(np.uint32)
+        bits = (values[:, VoiceFrame.bit_fields] >> VoiceFrame.bit_shifts) & 1
+        return np.packbits(bits.astype(np.uint8), axis=1, bitorder='little')
+
+    @staticmethod
+    def params2record(params):
+        """Convert result of Codec.encode() into record of VoiceFrame.dtype."""
+        record = np.zeros((), dtype=VoiceFrame.dtype)
+        for name, value in zip(VoiceFrame.dtype.names[:10], params['lar_idx']):
+            record[name] = value
+        for n in range(1, 4):
+            subframe = params['subframe%d' % n]
+            record['LTP%d_lag' % n] = subframe['LTP_lag']
+            record['LTP%d_gain' % n] = subframe['LTP_gain']
+            record['stochastic_gain%d' % n] = subframe['stochastic_gain']
+            record['st%d_dec' % n] = subframe['st_dec']
+            record['st%d_sig_ph' % n] = subframe['st_sig_ph']
+        return record
 
     def get_lars(self):
         d = {}
-        for k in self.values:
+        values = self.values
+        for k in values:
             if not k.startswith('LAR'):
                 continue
-            d[k] = self.values[k]
+            d[k] = values[k]
         return d
 
 
+class FrameRing:
+    """Ring buffer of the last n_frames frame records (VoiceFrame.dtype)
+    stored in one preallocated record array, index 0 is the oldest."""
+    def __init__(self, n_frames, dtype=VoiceFrame.dtype):
+        self.records = np.zeros(n_frames, dtype=dtype)
+# position of next write
+        self.pos = 0
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, record):
+        self.records[self.pos] = record
+        self.pos = (self.pos + 1) % len(self.records)
+        self.n = min(self.n + 1, len(self.records))
+
+    def extend(self, records):
+        """Append array of records."""
+        records = records[-len(self.records):]
+        idx = (self.pos + np.arange(len(records))) % len(self.records)
+        self.records[idx] = records
+        self.pos = (self.pos + len(records)) % len(self.records)
+        self.n = min(self.n + len(records), len(self.records))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError('FrameRing index out of range')
+        return self.records[(self.pos - self.n + i) % len(self.records)]
+
+    def to_array(self):
+        """Return copy of records ordered from the oldest."""
+        idx = (self.pos - self.n + np.arange(self.n)) % len(self.records)
+        return self.records[idx]
+
+
 def get_voice_frame(json_row):
     """Return VOICE frame data or None."""
-    j = json.loads(json_row)
-    if j['event'] != 'frame':
-        return
-    j = j['frame']
-    if j['type'] != 'VOICE':
-        return
-    j = j['data']
-    if j['encoding'] != 'hex':
+    return frame_log.get_voice_frame(json_row)
+
+
+def iter_frame_batches(file_name=None, batch_frames=1024):
+    """Yield frames data of frame container or JSON lines frame log (stdin
+    if file_name is None) in batches accepted by VoiceFrame.decode_many()."""
+    if file_name is not None and frame_container.is_container(file_name):
+        container = frame_container.FrameContainer(file_name)
+        for i in range(0, len(container), batch_frames):
+            yield container.data(i, i + batch_frames)
         return
-    return unhexlify(j['value'])
+    with frame_log.open_log(file_name) as in_file:
+        for frames in frame_log.iter_voice_frame_batches(in_file, batch_frames):
+            yield frame_log.voice_frames2array(frames)
+
+
+def write_csv(out, batches, fields):
+    """Write header and records of batches as CSV in print_cvs() format,
+    each batch is formatted by one string operation and written at once.
+    Returns number of records."""
+    out.write(''.join('%s,' % name for name in fields) + '\n')
+    row = '%d,' * len(fields) + '\n'
+    n = 0
+    for records in batches:
+        values = records.view(np.uint16).reshape(len(records), len(fields))
+        out.write((row * len(values)) % tuple(values.ravel().tolist()))
+        n += len(values)
+    return n
+
+
+def write_npz(out_file_name, batches, fields):
+    """Save coefficients of records of batches as columns (arrays named
+    by fields) of .npz file. Returns number of records."""
+    dtype = VoiceFrame.projection(tuple(fields))[1]
+    records = np.concatenate([np.zeros(0, dtype=dtype)] + list(batches))
+    np.savez(out_file_name, **{name: records[name] for name in fields})
+    return len(records)
+
+
+def field_list(value):
+    """Parse comma separated coefficient names of --fields."""
+    fields = value.split(',')
+    for name in fields:
+        if name not in VoiceFrame.coeffs:
+            raise argparse.ArgumentTypeError('invalid field: %s' % name)
+    return fields
 
 
 def print_cvs(items, print_head=False):
@@ -93,20 +252,27 @@ def print_cvs(items, print_head=False):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 1:
-        in_file = sys.stdin
-    elif len(sys.argv) == 2:
-        in_file = open(sys.argv[1], 'rt')
-    else:
-        raise ValueError('Invalid parameters')
-
-    first = True
-    for line in in_file:
-        frame = get_voice_frame(line)
-        if not frame:
-            continue
-
-        frame = VoiceFrame(frame)
-        print_cvs(frame.values, first)
-        first = False
+    parser = argparse.ArgumentParser(description='Export coefficients of '
+            'VOICE frames from frame log or frame container.')
+    parser.add_argument('file_name', nargs='?', metavar='FILE',
+            help='frame log or container (default stdin)')
+    parser.add_argument('--fields', type=field_list, metavar='FIELD[,FIELD...]',
+            help='comma separated exported coefficients (default all in '
+            'alphabetical order)')
+    parser.add_argument('--format', choices=('csv', 'npz'), default='csv')
+    parser.add_argument('--output', metavar='FILE',
+            help='output file (default stdout, required for npz)')
+    args = parser.parse_args()
+    if args.format == 'npz' and args.output is None:
+        parser.error('--format npz requires --output')
 
+    fields = args.fields or sorted(VoiceFrame.coeffs)
+    batches = (VoiceFrame.decode_many(frames, fields)
+            for frames in iter_frame_batches(args.file_name))
+    if args.format == 'npz':
+        write_npz(args.output, batches, fields)
+    elif args.output is None:
+        write_csv(sys.stdout, batches, fields)
+    else:
+        with open(args.output, 'w') as f:
+            write_csv(f, batches, fields)